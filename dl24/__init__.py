@@ -1,15 +1,19 @@
+import abc
 import binascii
 import datetime
 import logging
 import math
+import re
 import struct
 import time
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Iterator, Union, List, Any, Sequence, Dict, Hashable, Tuple, Callable
 
 import serial
 
 from dl24.crc import calc_crc_for_payload
+from dl24.policy import RetryPolicy, RttStats
+from dl24.metrics import Metrics
 
 logger = logging.getLogger("dl24.serial")
 
@@ -30,8 +34,12 @@ SETVCUT = 0x03
 SETTMR = 0x04
 RESET_COUNTERS = 0x05
 
-ByteWaitTime_s = 1
-PacketWaitTime_s = 1
+BROADCAST_LENGTH = 36
+VALUE_REPLY_LENGTH = 7
+
+ByteWaitTime_s = 0.01  # granularity of response deadlines
+PacketWaitTime_s = 1  # used until a round-trip time is measured
+BroadcastWaitTime_s = 2.5  # broadcasts come about once a second, waits for them are independent of request timeouts
 RetriesCount = 4
 
 
@@ -43,6 +51,62 @@ def unpack_uint16(data):
     return struct.unpack(">H", data[1:])[0]
 
 
+def unpack_time(data):
+    return datetime.timedelta(hours=data[0], minutes=data[1], seconds=data[2])
+
+
+_value_decoders = {
+    IS_ON: lambda pa: pa[2] == 1,
+    VOLTAGE: lambda pa: unpack_uint24(pa) / 1000,
+    CURRENT: lambda pa: unpack_uint24(pa) / 1000,
+    TIME: unpack_time,
+    CAP_AH: lambda pa: unpack_uint24(pa) / 1000,
+    CAP_WH: lambda pa: unpack_uint24(pa) / 1000,
+    TEMP: unpack_uint24,
+    LIM_CURR: lambda pa: unpack_uint16(pa) / 100,
+    LIM_VOLT: lambda pa: unpack_uint16(pa) / 100,
+    TIMER: lambda pa: datetime.timedelta(hours=pa[0], minutes=pa[1]),
+}
+
+
+def decode_value(register: int, data: bytes) -> Any:
+    return _value_decoders[register](data)
+
+
+def pack_decimal(value: float):
+    if not 0 <= value < 256:
+        raise ValueError(f"{value} is out of range, expected 0 to 255.99")
+    f, i = math.modf(value)
+    return [int(i), round(f * 100)]
+
+
+def pack_duration(duration: datetime.timedelta):
+    seconds = int(duration.total_seconds())
+    if not 0 <= seconds <= 0xffff:
+        raise ValueError(f"{seconds} s is out of range, expected 0 to 65535 s")
+    return [*struct.pack(">H", seconds)]
+
+
+def build_value_request(register: int) -> bytes:
+    return bytes([0xb1, 0xb2, register, 0, 0, 0xb6])
+
+
+def build_command(command: int, payload) -> bytes:
+    return bytes([0xb1, 0xb2, command, *payload, 0xb6])
+
+
+def plan_batch_retry(registers: Sequence[int], attempts: int, expired: bool) -> List[Tuple[Sequence[int], int]]:
+    # Batches to request again, with their remaining attempts, after a batch of value requests came back short,
+    # none when the read fails. Replies are not tagged with the register, so a short batch is split up and only
+    # the halves that come back incomplete again are re-requested.
+    if expired or (len(registers) == 1 and attempts <= 1):
+        return []
+    if len(registers) == 1:
+        return [(registers, attempts - 1)]
+    half = len(registers) // 2
+    return [(registers[:half], attempts), (registers[half:], attempts)]
+
+
 @dataclass
 class ValueReplyPacket:
     data: bytes
@@ -53,6 +117,23 @@ class AckReply:
     pass
 
 
+@dataclass
+class Snapshot:
+    is_on: bool
+    voltage: float  # V
+    current: float  # A
+    energy: float  # Wh
+    charge: float  # Ah
+    time: datetime.timedelta
+    temperature: int  # celsius
+    current_limit: float  # A
+    voltage_cutoff: float  # V
+    timer: datetime.timedelta
+
+
+SnapshotRegisters = [IS_ON, VOLTAGE, CURRENT, CAP_WH, CAP_AH, TIME, TEMP, LIM_CURR, LIM_VOLT, TIMER]
+
+
 @dataclass
 class BroadcastPacket:
     voltage: float  # V
@@ -67,6 +148,11 @@ class BroadcastPacket:
         return self.voltage * self.current
 
 
+# payload of a broadcast frame, without the ff55 header:
+# type, command, voltage (24 bit), current, capacity, energy, temperature, hours, minutes, seconds
+BroadcastStruct = struct.Struct(">2x3sxHxH2xH8xBxBBB6x")
+
+
 def _parse_broadcast(data: bytes) -> BroadcastPacket:
     #  0                        1                     2                         3
     #  0 1  2  3  4 5 6  7 8 9  0 1 2  3 4 5 6  7 8 9 0 1 2 3 4  5  6  7  8  9  0 1 2 3 4  5
@@ -74,203 +160,224 @@ def _parse_broadcast(data: bytes) -> BroadcastPacket:
     # HDR  TP CMD   VOL   CURR    CAP   ENERGY                 TEMP   HH MM SS            CRC
     # ff55 01 02 000073 002ee3 00240e 0000006f 0000000000000000 2d 00 07 2c 1c 3c00000000 a4
 
-    def get_int(format_: str, pos: int):
-        pos = pos - 2
-        b = data[pos:pos + struct.calcsize(format_)]
-        return struct.unpack(format_, b)[0]
-
+    voltage, current, capacity, energy, temperature, hours, minutes, seconds = BroadcastStruct.unpack(data)
     return BroadcastPacket(
-            voltage=get_int("B", 6) / 10,
-            current=get_int(">H", 8) / 1000,
-            capacity=get_int(">H", 11) * 10 / 1000,
-            energy=get_int(">H", 15) * 10,
-            temperature=get_int("B", 25),
-            time=datetime.timedelta(
-                    hours=get_int("B", 27),
-                    minutes=get_int("B", 28),
-                    seconds=get_int("B", 29)),
+            voltage=unpack_uint24(voltage) / 10,
+            current=current / 1000,
+            capacity=capacity * 10 / 1000,
+            energy=energy * 10,
+            temperature=temperature,
+            time=datetime.timedelta(seconds=hours * 3600 + minutes * 60 + seconds),
     )
 
 
-class DL24Error(Exception):
-    pass
-
-
-class DL24NoResponseError(DL24Error):
-    def __init__(self):
-        super().__init__("no response")
-
+Packet = Union[BroadcastPacket, ValueReplyPacket, AckReply]
+
+_header_re = re.compile(b"[\xff\xca\x6f]")
+
+
+class FrameDecoder:
+    def __init__(self, metrics: Optional[Metrics] = None):
+        self.buffer = bytearray()
+        self.pos = 0
+        self.metrics = metrics or Metrics()
+
+    def feed(self, data: bytes):
+        if self.pos > 0:
+            del self.buffer[:self.pos]
+            self.pos = 0
+        self.buffer += data
+
+    def _discard(self, count: int):
+        self.pos += count
+        self.metrics.discarded_bytes += count
+
+    def next_packet(self) -> Optional[Packet]:
+        buf = self.buffer
+        while self.pos < len(buf):
+            pos = self.pos
+            available = len(buf) - pos
+            header = buf[pos]
+
+            if header == 0xff:
+                if available < 2:
+                    return None
+                if buf[pos + 1] != 0x55:
+                    self._discard(1)
+                    continue
+                if available < BROADCAST_LENGTH:
+                    return None
+                payload = bytes(buf[pos + 2:pos + BROADCAST_LENGTH])
+                if calc_crc_for_payload(payload[:-1]) != payload[-1]:
+                    # only another broadcast can start inside a corrupted one, e.g. after a dropped byte,
+                    # value or ACK bytes in its payload are not replies
+                    self.metrics.crc_failures += 1
+                    m = buf.find(b"\xff\x55", pos + 1, pos + BROADCAST_LENGTH + 1)
+                    self._discard((m if m >= 0 else pos + BROADCAST_LENGTH) - pos)
+                    continue
+                self.pos += BROADCAST_LENGTH
+                self.metrics.frames["broadcast"] += 1
+                return _parse_broadcast(payload)
+
+            elif header == 0xca:
+                if available < 2:
+                    return None
+                if buf[pos + 1] != 0xcb:
+                    self._discard(1)
+                    continue
+                if available < VALUE_REPLY_LENGTH:
+                    return None
+                if buf[pos + 5:pos + 7] != b'\xce\xcf':
+                    self._discard(1)
+                    continue
+                self.pos += VALUE_REPLY_LENGTH
+                self.metrics.frames["value"] += 1
+                return ValueReplyPacket(data=bytes(buf[pos + 2:pos + 5]))
+
+            elif header == 0x6f:
+                self.pos += 1
+                self.metrics.frames["ack"] += 1
+                return AckReply()
+
+            else:
+                m = _header_re.search(buf, pos + 1)
+                self._discard((m.start() if m is not None else len(buf)) - pos)
+
+        return None
+
+    def __iter__(self) -> Iterator[Packet]:
+        while True:
+            p = self.next_packet()
+            if p is None:
+                return
+            yield p
 
-class DL24SerialError(DL24Error):
-    def __init__(self, e: Exception):
-        super().__init__(f"serial error: {e}")
 
+SettingsRegisters = (IS_ON, LIM_CURR, LIM_VOLT, TIMER)
 
-class DL24:
-    def __init__(self, port: str):
-        try:
-            self.serial = serial.Serial(port=port, timeout=ByteWaitTime_s,
-                                        baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE)
-        except serial.SerialException as e:
-            raise DL24SerialError(e)
-
-    def close(self):
-        self.serial.close()
-
-    def _serial_read(self, length: int):
-        try:
-            data = self.serial.read(length)
-        except serial.SerialException as e:
-            raise DL24SerialError(e)
 
-        if data is None:
-            logger.debug("[read] <none>")
-        else:
-            logger.debug("[read] " + binascii.hexlify(data, " ").decode("ascii"))
-        return data
+class SettingsCache:
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        self.values: Dict[int, Tuple[Any, float]] = {}
 
-    def _serial_write(self, data: bytes):
-        logger.debug("[write] " + binascii.hexlify(data, " ").decode("ascii"))
+    def get(self, register: int) -> Tuple[bool, Any]:
+        entry = self.values.get(register)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            return False, None
+        return True, entry[0]
 
-        try:
-            self.serial.write(data)
-        except serial.SerialException as e:
-            raise DL24SerialError(e)
+    def put(self, register: int, value: Any):
+        if register in SettingsRegisters:
+            self.values[register] = (value, time.monotonic())
 
-    def _read_packet(self):
-        packet_type = self._serial_read(1)
-        if packet_type == b'\xca':
-            d = self._serial_read(1)
-            if len(d) == 0:
-                return None
-            return self._read_value_resp()
-        elif packet_type == b'\xff':
-            d = self._serial_read(1)
-            if len(d) == 0:
-                return None
-            return self._read_broadcast()
-        elif packet_type == b'\x6f':
-            return AckReply()
+    def invalidate(self, register: Optional[int] = None):
+        if register is None:
+            self.values.clear()
         else:
-            self._serial_read(self.serial.in_waiting)
-            return None
+            self.values.pop(register, None)
+
+    def on_command(self, command: int, payload):
+        if command == OUTPUT:
+            self.put(IS_ON, payload[0] == 1)
+        elif command == SETCURR:
+            self.put(LIM_CURR, payload[0] + payload[1] / 100)
+        elif command == SETVCUT:
+            self.put(LIM_VOLT, payload[0] + payload[1] / 100)
+        elif command == SETTMR:
+            minutes = struct.unpack(">H", bytes(payload))[0] // 60
+            self.put(TIMER, datetime.timedelta(minutes=minutes))
+
+    def on_broadcast(self, packet: BroadcastPacket):
+        # the output is switched off by the device itself when the cutoff voltage or the timer is reached
+        hit, is_on = self.get(IS_ON)
+        if hit and is_on != (packet.current > 0):
+            self.invalidate(IS_ON)
 
-    def _read_broadcast(self) -> Optional[BroadcastPacket]:
-        resp = self._serial_read(36 - 2)
-        if len(resp) != 34:
-            return None
 
-        crc = calc_crc_for_payload(resp[:-1])
-        if crc != resp[-1]:
-            return None
-
-        return _parse_broadcast(resp)
+class DL24Error(Exception):
+    pass
 
-    def _read_value_resp(self) -> ValueReplyPacket:
-        resp = self._serial_read(7 - 2)
 
-        if resp[-2:] != b'\xce\xcf':
-            raise DL24Error("invalid resp")
+class DL24NoResponseError(DL24Error):
+    def __init__(self):
+        super().__init__("no response")
 
-        return ValueReplyPacket(data=resp[:-2])
 
-    def _wait_for_packet(self, packet_type):
-        p = self._read_packet()
+class DL24SerialError(DL24Error):
+    def __init__(self, e: Exception):
+        super().__init__(f"serial error: {e}")
 
-        s = time.time()
-        while not isinstance(p, packet_type) or p is None:
-            p = self._read_packet()
-            if time.time() - s > PacketWaitTime_s:
-                raise DL24NoResponseError()
 
-        if not isinstance(p, packet_type):
-            raise DL24Error("invalid packet")
-        return p
+class BaseDL24(abc.ABC):
+    @abc.abstractmethod
+    def close(self):
+        pass
 
-    def wait_for_broadcast(self):
-        return self._wait_for_packet(BroadcastPacket)
+    @abc.abstractmethod
+    def wait_for_broadcast(self, timeout: float = BroadcastWaitTime_s) -> BroadcastPacket:
+        pass
 
-    def read_value(self, payload):
-        logger.debug(f"reading value {hex(payload[0])}...")
-        frame = bytearray([0xb1, 0xb2, *payload, 0xb6])
+    def stream_broadcasts(self) -> Iterator[BroadcastPacket]:
+        while True:
+            yield self.wait_for_broadcast()
 
-        for retry in range(0, RetriesCount):
-            try:
-                self._serial_write(frame)
-                p = self._wait_for_packet(ValueReplyPacket)
-                return p.data
-            except DL24NoResponseError:
-                logger.debug("retrying command...")
-                pass
+    @abc.abstractmethod
+    def read_value(self, payload, deadline: Optional[float] = None) -> bytes:
+        pass
 
-        raise DL24NoResponseError
+    @abc.abstractmethod
+    def read_values(self, registers: Sequence[int], deadline: Optional[float] = None) -> List[Any]:
+        pass
 
-    def execute_command(self, command, payload):
-        logger.debug(f"executing command {hex(command)}...")
-        frame = bytearray([0xb1, 0xb2, command, *payload, 0xb6])
+    @abc.abstractmethod
+    def execute_command(self, command, payload, deadline: Optional[float] = None):
+        pass
 
-        for retry in range(0, RetriesCount):
-            try:
-                self._serial_write(frame)
-                self._wait_for_packet(AckReply)
-                return
-            except DL24NoResponseError:
-                logger.debug("retrying command...")
-                pass
+    def _read_register(self, register: int) -> Any:
+        return decode_value(register, self.read_value([register, 0, 0]))
 
-        raise DL24NoResponseError
+    def snapshot(self) -> Snapshot:
+        return Snapshot(*self.read_values(SnapshotRegisters))
 
     def get_is_on(self) -> bool:
-        pa = self.read_value([IS_ON, 0, 0])
-        return pa[2] == 1
+        return self._read_register(IS_ON)
 
     def get_voltage(self) -> float:
-        pa = self.read_value([VOLTAGE, 0, 0])
-        return unpack_uint24(pa) / 1000
+        return self._read_register(VOLTAGE)
 
     def get_current(self) -> float:
-        pa = self.read_value([CURRENT, 0, 0])
-        return unpack_uint24(pa) / 1000
+        return self._read_register(CURRENT)
 
     def get_energy(self) -> float:
-        pa = self.read_value([CAP_WH, 0, 0])
-        return unpack_uint24(pa) / 1000
+        return self._read_register(CAP_WH)
 
     def get_charge(self) -> float:
-        pa = self.read_value([CAP_AH, 0, 0])
-        return unpack_uint24(pa) / 1000
+        return self._read_register(CAP_AH)
 
     def get_time(self) -> datetime.timedelta:
-        pa = self.read_value([TIME, 0, 0])
-        return datetime.timedelta(hours=pa[0], minutes=pa[1], seconds=pa[2])
+        return self._read_register(TIME)
 
     def get_temp(self) -> int:
-        pa = self.read_value([TEMP, 0, 0])
-        return unpack_uint24(pa)
+        return self._read_register(TEMP)
 
     def get_current_limit(self) -> float:
-        pa = self.read_value([LIM_CURR, 0, 0])
-        return unpack_uint16(pa) / 100
+        return self._read_register(LIM_CURR)
 
     def get_voltage_cutoff(self) -> float:
-        pa = self.read_value([LIM_VOLT, 0, 0])
-        return unpack_uint16(pa) / 100
+        return self._read_register(LIM_VOLT)
 
     def get_timer(self) -> datetime.timedelta:
-        pa = self.read_value([TIMER, 0, 0])
-        return datetime.timedelta(hours=pa[0], minutes=pa[1])
+        return self._read_register(TIMER)
 
     def set_current(self, current: float):
-        f, i = math.modf(current)
-        self.execute_command(SETCURR, [int(i), round(f * 100)])
+        self.execute_command(SETCURR, pack_decimal(current))
 
     def set_voltage_cutoff(self, voltage: float):
-        f, i = math.modf(voltage)
-        self.execute_command(SETVCUT, [int(i), round(f * 100)])
+        self.execute_command(SETVCUT, pack_decimal(voltage))
 
     def set_timer(self, duration: datetime.timedelta):
-        value = struct.pack(">H", int(duration.total_seconds()))
-        self.execute_command(SETTMR, [*value])
+        self.execute_command(SETTMR, pack_duration(duration))
 
     def reset_counters(self):
         self.execute_command(RESET_COUNTERS, [0, 0])
@@ -282,8 +389,225 @@ class DL24:
         self.execute_command(OUTPUT, [0, 0])
 
 
+class DL24(BaseDL24):
+    def __init__(self, port: str, policy: Optional[RetryPolicy] = None, metrics: Optional[Metrics] = None,
+                 cache: Optional[SettingsCache] = None, capture=None, transport=None):
+        # capture: a dl24.capture.CaptureWriter receiving every byte read and written
+        # transport: used instead of opening the serial port, e.g. dl24.capture.ReplaySerial
+        self.policy = policy or RetryPolicy(initial_timeout=PacketWaitTime_s, retries=RetriesCount)
+        self.metrics = metrics or Metrics()
+        self.cache = cache
+        self.broadcast_listeners: List[Callable[[BroadcastPacket], None]] = []
+        self.capture = capture
+
+        if transport is not None:
+            self.serial = transport
+            self.decoder = FrameDecoder(self.metrics)
+            return
+
+        try:
+            self.serial = serial.Serial(port=port, timeout=ByteWaitTime_s,
+                                        baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE)
+        except serial.SerialException as e:
+            self.metrics.serial_errors += 1
+            raise DL24SerialError(e)
+
+        self.decoder = FrameDecoder(self.metrics)
+
+    def close(self):
+        self.serial.close()
+
+    def _serial_read(self, length: int):
+        try:
+            data = self.serial.read(length)
+        except serial.SerialException as e:
+            self.metrics.serial_errors += 1
+            raise DL24SerialError(e)
+
+        if self.capture is not None and data:
+            self.capture.record_read(data)
+        if logger.isEnabledFor(logging.DEBUG):
+            if data is None:
+                logger.debug("[read] <none>")
+            elif len(data) > 0:
+                logger.debug("[read] " + binascii.hexlify(data, " ").decode("ascii"))
+        return data
+
+    def _serial_write(self, data: bytes):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[write] " + binascii.hexlify(data, " ").decode("ascii"))
+        if self.capture is not None:
+            self.capture.record_write(data)
+
+        try:
+            self.serial.write(data)
+        except serial.SerialException as e:
+            self.metrics.serial_errors += 1
+            raise DL24SerialError(e)
+
+    def _on_broadcast(self, packet: BroadcastPacket):
+        if self.cache is not None:
+            self.cache.on_broadcast(packet)
+        for listener in self.broadcast_listeners:
+            listener(packet)
+
+    def _read_packet(self) -> Optional[Packet]:
+        while True:
+            p = self.decoder.next_packet()
+            if p is not None:
+                if isinstance(p, BroadcastPacket):
+                    self._on_broadcast(p)
+                return p
+
+            data = self._serial_read(max(1, self.serial.in_waiting))
+            if data is None or len(data) == 0:
+                return None
+            self.decoder.feed(data)
+
+    def _wait_for_packet(self, packet_type, timeout: float = PacketWaitTime_s):
+        deadline = time.monotonic() + timeout
+        while True:
+            p = self._read_packet()
+            if isinstance(p, packet_type):
+                return p
+            if time.monotonic() >= deadline:
+                raise DL24NoResponseError()
+
+    def _drop_stale_replies(self):
+        # a reply that arrived after its request timed out must not be taken as the reply to the next request
+        if self.serial.in_waiting > 0:
+            self.decoder.feed(self._serial_read(self.serial.in_waiting))
+        for p in self.decoder:
+            if isinstance(p, BroadcastPacket):
+                self._on_broadcast(p)
+            else:
+                logger.debug("dropping stale reply")
+
+    def _request(self, kind: str, key: int, frame: bytes, packet_type, deadline: Optional[float]):
+        self._drop_stale_replies()
+
+        for retry in range(0, self.policy.retries):
+            timeout = self.policy.timeout(key)
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+            if retry > 0:
+                self.metrics.retries += 1
+
+            try:
+                sent = time.monotonic()
+                self._serial_write(frame)
+                p = self._wait_for_packet(packet_type, timeout)
+                rtt = time.monotonic() - sent
+                self.metrics.observe_latency(kind, key, rtt)
+                if retry == 0:  # replies are not tagged, so retransmitted requests give ambiguous samples
+                    self.policy.observe(key, rtt)
+                return p
+            except DL24NoResponseError:
+                self.metrics.timeouts += 1
+                self.policy.on_timeout(key)
+                logger.debug("retrying command...")
+
+        raise DL24NoResponseError
+
+    def wait_for_broadcast(self, timeout: float = BroadcastWaitTime_s) -> BroadcastPacket:
+        return self._wait_for_packet(BroadcastPacket, timeout)
+
+    def read_value(self, payload, deadline: Optional[float] = None) -> bytes:
+        logger.debug("reading value 0x%x...", payload[0])
+        frame = bytearray([0xb1, 0xb2, *payload, 0xb6])
+        return self._request("read", payload[0], frame, ValueReplyPacket, deadline).data
+
+    def execute_command(self, command, payload, deadline: Optional[float] = None):
+        logger.debug("executing command 0x%x...", command)
+        frame = build_command(command, payload)
+        try:
+            self._request("command", command, frame, AckReply, deadline)
+        except DL24Error:
+            # the command may have been applied even though its ACK was lost
+            if self.cache is not None:
+                self.cache.invalidate()
+            raise
+        if self.cache is not None:
+            self.cache.on_command(command, payload)
+
+    def rtt_stats(self) -> Dict[Hashable, RttStats]:
+        return self.policy.stats()
+
+    def _read_register(self, register: int) -> Any:
+        if self.cache is not None:
+            hit, value = self.cache.get(register)
+            if hit:
+                return value
+
+        value = decode_value(register, self.read_value([register, 0, 0]))
+        if self.cache is not None:
+            self.cache.put(register, value)
+        return value
+
+    def _read_values_batch(self, registers: Sequence[int], attempts: int, deadline: Optional[float]) -> List[bytes]:
+        sent = time.monotonic()
+        self._serial_write(b"".join(build_value_request(x) for x in registers))
+
+        replies = []
+        try:
+            while len(replies) < len(registers):
+                register = registers[len(replies)]
+                timeout = self.policy.timeout(register)
+                if deadline is not None:
+                    timeout = min(timeout, deadline - time.monotonic())
+                replies.append(self._wait_for_packet(ValueReplyPacket, timeout).data)
+                self.metrics.observe_latency("read", register, time.monotonic() - sent)
+                if len(replies) == 1 and attempts == self.policy.retries:
+                    self.policy.observe(register, time.monotonic() - sent)
+            return replies
+        except DL24NoResponseError:
+            self.metrics.timeouts += 1
+            self.policy.on_timeout(registers[len(replies)])
+            batches = plan_batch_retry(registers, attempts, deadline is not None and time.monotonic() >= deadline)
+            if len(batches) == 0:
+                raise
+
+        logger.debug("retrying %d values...", len(registers))
+        self.metrics.retries += 1
+        self._drop_stale_replies()
+        return [x for batch, left in batches for x in self._read_values_batch(batch, left, deadline)]
+
+    def read_values(self, registers: Sequence[int], deadline: Optional[float] = None) -> List[Any]:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"reading values {', '.join(hex(x) for x in registers)}...")
+        values: Dict[int, Any] = {}
+        if self.cache is not None:
+            for register in registers:
+                hit, value = self.cache.get(register)
+                if hit:
+                    values[register] = value
+
+        missing = [x for x in dict.fromkeys(registers) if x not in values]
+        if len(missing) > 0:
+            self._drop_stale_replies()
+            replies = self._read_values_batch(missing, self.policy.retries, deadline)
+            for register, data in zip(missing, replies):
+                values[register] = decode_value(register, data)
+                if self.cache is not None:
+                    self.cache.put(register, values[register])
+
+        return [values[register] for register in registers]
+
+
 __all__ = [
+    "BaseDL24",
     "DL24",
+    "BroadcastPacket",
+    "Snapshot",
+    "ValueReplyPacket",
+    "AckReply",
+    "FrameDecoder",
+    "RetryPolicy",
+    "RttStats",
+    "Metrics",
+    "SettingsCache",
     "DL24Error",
     "DL24SerialError",
     "DL24NoResponseError",
@@ -0,0 +1,277 @@
+import asyncio
+import datetime
+import logging
+from typing import Optional, List, Any, Sequence, AsyncIterator, Dict, Hashable
+
+import serial
+import serial_asyncio
+
+from dl24 import IS_ON, VOLTAGE, CURRENT, TIME, CAP_AH, CAP_WH, TEMP, LIM_CURR, LIM_VOLT, TIMER, \
+    OUTPUT, SETCURR, SETVCUT, SETTMR, RESET_COUNTERS, PacketWaitTime_s, BroadcastWaitTime_s, RetriesCount, SnapshotRegisters, \
+    FrameDecoder, BroadcastPacket, ValueReplyPacket, AckReply, Snapshot, RetryPolicy, RttStats, Metrics, \
+    DL24Error, DL24NoResponseError, DL24SerialError, \
+    decode_value, build_value_request, build_command, plan_batch_retry, pack_decimal, pack_duration
+
+logger = logging.getLogger("dl24.serial")
+
+BroadcastQueueSize = 64
+
+
+class _SerialProtocol(asyncio.Protocol):
+    def __init__(self, dl24: "AsyncDL24"):
+        self.dl24 = dl24
+
+    def data_received(self, data: bytes):
+        self.dl24._data_received(data)
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self.dl24._connection_lost(exc)
+
+
+class AsyncDL24:
+    def __init__(self, policy: Optional[RetryPolicy] = None, metrics: Optional[Metrics] = None):
+        self.policy = policy or RetryPolicy(initial_timeout=PacketWaitTime_s, retries=RetriesCount)
+        self.metrics = metrics or Metrics()
+        self.decoder = FrameDecoder(self.metrics)
+        self.transport: Optional[asyncio.Transport] = None
+        self._lock = asyncio.Lock()
+        self._replies: asyncio.Queue = asyncio.Queue()
+        self._subscribers: List[asyncio.Queue] = []
+        self._error: Optional[DL24Error] = None
+
+    @classmethod
+    async def open(cls, port: str, policy: Optional[RetryPolicy] = None, metrics: Optional[Metrics] = None) -> "AsyncDL24":
+        dl24 = cls(policy, metrics)
+        try:
+            dl24.transport, _ = await serial_asyncio.create_serial_connection(
+                    asyncio.get_running_loop(), lambda: _SerialProtocol(dl24), port,
+                    baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE)
+        except serial.SerialException as e:
+            dl24.metrics.serial_errors += 1
+            raise DL24SerialError(e)
+        return dl24
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def _data_received(self, data: bytes):
+        self.decoder.feed(data)
+        for p in self.decoder:
+            if isinstance(p, BroadcastPacket):
+                for queue in self._subscribers:
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(p)
+            else:
+                self._replies.put_nowait(p)
+
+    def _connection_lost(self, exc: Optional[Exception]):
+        if exc is not None:
+            self.metrics.serial_errors += 1
+        self._error = DL24SerialError(exc) if exc is not None else DL24Error("port closed")
+        self._replies.put_nowait(None)
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    def _check_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _write(self, data: bytes):
+        self._check_error()
+        self.transport.write(data)
+
+    async def _get(self, queue: asyncio.Queue, timeout: float):
+        try:
+            p = await asyncio.wait_for(queue.get(), timeout)
+        except asyncio.TimeoutError:
+            raise DL24NoResponseError()
+        if p is None:
+            queue.put_nowait(None)
+            self._check_error()
+        return p
+
+    async def _wait_for_reply(self, packet_type, timeout: float):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            p = await self._get(self._replies, max(0.0, deadline - loop.time()))
+            if isinstance(p, packet_type):
+                return p
+
+    def _drop_stale_replies(self):
+        while not self._replies.empty():
+            p = self._replies.get_nowait()
+            if p is None:
+                self._replies.put_nowait(None)
+                self._check_error()
+
+    async def broadcasts(self) -> AsyncIterator[BroadcastPacket]:
+        queue = asyncio.Queue(BroadcastQueueSize)
+        self._subscribers.append(queue)
+        try:
+            while True:
+                self._check_error()
+                p = await queue.get()
+                if p is None:
+                    self._check_error()
+                yield p
+        finally:
+            self._subscribers.remove(queue)
+
+    async def wait_for_broadcast(self, timeout: float = BroadcastWaitTime_s) -> BroadcastPacket:
+        queue = asyncio.Queue(1)
+        self._subscribers.append(queue)
+        try:
+            return await self._get(queue, timeout)
+        finally:
+            self._subscribers.remove(queue)
+
+    async def _request(self, kind: str, key: int, frame: bytes, packet_type, deadline: Optional[float]):
+        loop = asyncio.get_running_loop()
+
+        async with self._lock:
+            self._drop_stale_replies()
+            for retry in range(0, self.policy.retries):
+                timeout = self.policy.timeout(key)
+                if deadline is not None:
+                    timeout = min(timeout, deadline - loop.time())
+                    if timeout <= 0:
+                        break
+                if retry > 0:
+                    self.metrics.retries += 1
+
+                try:
+                    sent = loop.time()
+                    self._write(frame)
+                    p = await self._wait_for_reply(packet_type, timeout)
+                    rtt = loop.time() - sent
+                    self.metrics.observe_latency(kind, key, rtt)
+                    if retry == 0:
+                        self.policy.observe(key, rtt)
+                    return p
+                except DL24NoResponseError:
+                    self.metrics.timeouts += 1
+                    self.policy.on_timeout(key)
+                    logger.debug("retrying command...")
+
+        raise DL24NoResponseError
+
+    async def read_value(self, payload, deadline: Optional[float] = None) -> bytes:
+        logger.debug("reading value 0x%x...", payload[0])
+        frame = bytes([0xb1, 0xb2, *payload, 0xb6])
+        return (await self._request("read", payload[0], frame, ValueReplyPacket, deadline)).data
+
+    async def execute_command(self, command, payload, deadline: Optional[float] = None):
+        logger.debug("executing command 0x%x...", command)
+        frame = build_command(command, payload)
+        await self._request("command", command, frame, AckReply, deadline)
+
+    def rtt_stats(self) -> Dict[Hashable, RttStats]:
+        return self.policy.stats()
+
+    async def _read_values_batch(self, registers: Sequence[int], attempts: int, deadline: Optional[float]) -> List[bytes]:
+        loop = asyncio.get_running_loop()
+        sent = loop.time()
+        self._write(b"".join(build_value_request(x) for x in registers))
+
+        replies = []
+        try:
+            while len(replies) < len(registers):
+                register = registers[len(replies)]
+                timeout = self.policy.timeout(register)
+                if deadline is not None:
+                    timeout = min(timeout, deadline - loop.time())
+                replies.append((await self._wait_for_reply(ValueReplyPacket, timeout)).data)
+                self.metrics.observe_latency("read", register, loop.time() - sent)
+                if len(replies) == 1 and attempts == self.policy.retries:
+                    self.policy.observe(register, loop.time() - sent)
+            return replies
+        except DL24NoResponseError:
+            self.metrics.timeouts += 1
+            self.policy.on_timeout(registers[len(replies)])
+            batches = plan_batch_retry(registers, attempts, deadline is not None and loop.time() >= deadline)
+            if len(batches) == 0:
+                raise
+
+        logger.debug("retrying %d values...", len(registers))
+        self.metrics.retries += 1
+        self._drop_stale_replies()
+        replies = []
+        for batch, left in batches:
+            replies += await self._read_values_batch(batch, left, deadline)
+        return replies
+
+    async def read_values(self, registers: Sequence[int], deadline: Optional[float] = None) -> List[Any]:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"reading values {', '.join(hex(x) for x in registers)}...")
+        unique = list(dict.fromkeys(registers))
+        if len(unique) == 0:
+            return []
+        async with self._lock:
+            self._drop_stale_replies()
+            replies = await self._read_values_batch(unique, self.policy.retries, deadline)
+        values = {register: decode_value(register, data) for register, data in zip(unique, replies)}
+        return [values[register] for register in registers]
+
+    async def snapshot(self) -> Snapshot:
+        return Snapshot(*await self.read_values(SnapshotRegisters))
+
+    async def _read_register(self, register: int) -> Any:
+        return decode_value(register, await self.read_value([register, 0, 0]))
+
+    async def get_is_on(self) -> bool:
+        return await self._read_register(IS_ON)
+
+    async def get_voltage(self) -> float:
+        return await self._read_register(VOLTAGE)
+
+    async def get_current(self) -> float:
+        return await self._read_register(CURRENT)
+
+    async def get_energy(self) -> float:
+        return await self._read_register(CAP_WH)
+
+    async def get_charge(self) -> float:
+        return await self._read_register(CAP_AH)
+
+    async def get_time(self) -> datetime.timedelta:
+        return await self._read_register(TIME)
+
+    async def get_temp(self) -> int:
+        return await self._read_register(TEMP)
+
+    async def get_current_limit(self) -> float:
+        return await self._read_register(LIM_CURR)
+
+    async def get_voltage_cutoff(self) -> float:
+        return await self._read_register(LIM_VOLT)
+
+    async def get_timer(self) -> datetime.timedelta:
+        return await self._read_register(TIMER)
+
+    async def set_current(self, current: float):
+        await self.execute_command(SETCURR, pack_decimal(current))
+
+    async def set_voltage_cutoff(self, voltage: float):
+        await self.execute_command(SETVCUT, pack_decimal(voltage))
+
+    async def set_timer(self, duration: datetime.timedelta):
+        await self.execute_command(SETTMR, pack_duration(duration))
+
+    async def reset_counters(self):
+        await self.execute_command(RESET_COUNTERS, [0, 0])
+
+    async def enable(self):
+        await self.execute_command(OUTPUT, [1, 0])
+
+    async def disable(self):
+        await self.execute_command(OUTPUT, [0, 0])
+
+
+__all__ = [
+    "AsyncDL24",
+]
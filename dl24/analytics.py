@@ -0,0 +1,179 @@
+import collections
+from dataclasses import dataclass
+from typing import Optional, Deque, Tuple
+
+from dl24 import BroadcastPacket
+
+MaxGap_s = 10  # longer gaps between samples are not integrated
+StepThreshold_A = 0.1  # minimum current change between two samples taken as a step for the resistance estimate
+
+
+@dataclass
+class AnalyticsResult:
+    charge: float  # Ah, integrated on the host
+    energy: float  # Wh, integrated on the host
+    device_charge: float  # Ah, change of the device counter since the first sample
+    device_energy: float  # Wh, change of the device counter since the first sample
+    internal_resistance: Optional[float]  # ohm, mean of the estimates from current steps
+    resistance_samples: int
+    voltage_min: Optional[float]  # V, over the rolling window
+    voltage_max: Optional[float]  # V
+    voltage_mean: Optional[float]  # V
+    current_mean: Optional[float]  # A
+    time_to_cutoff: Optional[float]  # s, extrapolated from the voltage slope over the rolling window
+
+    @property
+    def charge_error(self) -> float:
+        return self.charge - self.device_charge
+
+    @property
+    def energy_error(self) -> float:
+        return self.energy - self.device_energy
+
+
+class RollingWindow:
+    # min, max, mean and least-squares slope of the samples from the last `span` seconds;
+    # memory is bounded by the number of samples in the window
+    def __init__(self, span: float):
+        self.span = span
+        self.samples: Deque[Tuple[float, float]] = collections.deque()
+        self._min: Deque[Tuple[float, float]] = collections.deque()
+        self._max: Deque[Tuple[float, float]] = collections.deque()
+        self._removed = 0
+        self._reset_sums()
+
+    def _reset_sums(self):
+        self.origin = self.samples[0][0] if self.samples else 0.0
+        self.sum_t = self.sum_v = self.sum_tt = self.sum_tv = 0.0
+        for t, v in self.samples:
+            self._add_sums(t, v, 1)
+
+    def _add_sums(self, t: float, v: float, sign: int):
+        t -= self.origin
+        self.sum_t += sign * t
+        self.sum_v += sign * v
+        self.sum_tt += sign * t * t
+        self.sum_tv += sign * t * v
+
+    def add(self, t: float, v: float):
+        sample = (t, v)
+        self.samples.append(sample)
+        self._add_sums(t, v, 1)
+        while self._min and self._min[-1][1] >= v:
+            self._min.pop()
+        self._min.append(sample)
+        while self._max and self._max[-1][1] <= v:
+            self._max.pop()
+        self._max.append(sample)
+
+        while self.samples[0][0] < t - self.span:
+            old = self.samples.popleft()
+            self._add_sums(*old, -1)
+            if self._min[0] is old:
+                self._min.popleft()
+            if self._max[0] is old:
+                self._max.popleft()
+            self._removed += 1
+
+        # running sums lose precision when values are subtracted for a long time, rebuild them once per window
+        if self._removed >= len(self.samples):
+            self._removed = 0
+            self._reset_sums()
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def min(self) -> Optional[float]:
+        return self._min[0][1] if self._min else None
+
+    @property
+    def max(self) -> Optional[float]:
+        return self._max[0][1] if self._max else None
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum_v / len(self.samples) if self.samples else None
+
+    @property
+    def slope(self) -> Optional[float]:  # per second
+        n = len(self.samples)
+        if n < 3:
+            return None
+        denominator = n * self.sum_tt - self.sum_t * self.sum_t
+        if denominator <= 0:
+            return None
+        return (n * self.sum_tv - self.sum_t * self.sum_v) / denominator
+
+
+class StreamingAnalytics:
+    def __init__(self, cutoff_voltage: Optional[float] = None, window: float = 60):
+        self.cutoff_voltage = cutoff_voltage
+        self.voltage = RollingWindow(window)
+        self.current = RollingWindow(window)
+
+        self.charge = 0.0
+        self.energy = 0.0
+        self.resistance_sum = 0.0
+        self.resistance_samples = 0
+
+        self._last: Optional[Tuple[float, BroadcastPacket]] = None
+        self._device_charge = 0.0  # accumulated over counter resets
+        self._device_energy = 0.0
+
+    def add(self, t: float, packet: BroadcastPacket):
+        # t in seconds from any fixed reference
+        if self._last is not None:
+            last_t, last = self._last
+            dt = t - last_t
+            counting = packet.capacity >= last.capacity and packet.energy >= last.energy
+            if 0 < dt <= MaxGap_s:
+                self.charge += (last.current + packet.current) / 2 * dt / 3600
+                self.energy += (last.power + packet.power) / 2 * dt / 3600
+            elif dt > MaxGap_s and counting:
+                # samples are missing (e.g. a reconnect), take what the device counted meanwhile
+                self.charge += packet.capacity - last.capacity
+                self.energy += packet.energy - last.energy
+
+            if counting:
+                self._device_charge += packet.capacity - last.capacity
+                self._device_energy += packet.energy - last.energy
+
+            d_current = packet.current - last.current
+            if abs(d_current) >= StepThreshold_A and dt <= MaxGap_s:
+                resistance = (last.voltage - packet.voltage) / d_current
+                if resistance > 0:
+                    self.resistance_sum += resistance
+                    self.resistance_samples += 1
+
+        self._last = (t, packet)
+        self.voltage.add(t, packet.voltage)
+        self.current.add(t, packet.current)
+
+    def time_to_cutoff(self) -> Optional[float]:
+        slope = self.voltage.slope
+        if self.cutoff_voltage is None or slope is None or slope >= 0 or self._last is None:
+            return None
+        return max(0.0, (self._last[1].voltage - self.cutoff_voltage) / -slope)
+
+    def result(self) -> AnalyticsResult:
+        return AnalyticsResult(
+                charge=self.charge,
+                energy=self.energy,
+                device_charge=self._device_charge,
+                device_energy=self._device_energy,
+                internal_resistance=self.resistance_sum / self.resistance_samples if self.resistance_samples > 0 else None,
+                resistance_samples=self.resistance_samples,
+                voltage_min=self.voltage.min,
+                voltage_max=self.voltage.max,
+                voltage_mean=self.voltage.mean,
+                current_mean=self.current.mean,
+                time_to_cutoff=self.time_to_cutoff(),
+        )
+
+
+__all__ = [
+    "AnalyticsResult",
+    "RollingWindow",
+    "StreamingAnalytics",
+]
@@ -0,0 +1,83 @@
+import os
+import struct
+import datetime
+from typing import BinaryIO
+
+from dl24 import BroadcastPacket
+
+# File layout: 16-byte header followed by fixed-size little-endian records.
+# Timestamps are the local wall clock time as written to CSV logs, stored as seconds since 1970-01-01.
+MAGIC = b"DL24LOG\x00"
+VERSION = 1
+
+HeaderStruct = struct.Struct("<8sHH4x")
+RecordStruct = struct.Struct("<dffffhHI")  # timestamp, voltage, current, energy, charge, temperature, flags, on-time
+
+FLAG_AFTER_GAP = 0x0001  # samples are missing between the previous record and this one
+
+HEADER_SIZE = HeaderStruct.size
+RECORD_SIZE = RecordStruct.size
+
+_epoch = datetime.datetime(1970, 1, 1)
+
+
+class BinaryLogError(Exception):
+    pass
+
+
+def datetime_to_timestamp(date: datetime.datetime) -> float:
+    return (date - _epoch).total_seconds()
+
+
+def is_binary_log(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_header(f: BinaryIO):
+    data = f.read(HEADER_SIZE)
+    if len(data) != HEADER_SIZE:
+        raise BinaryLogError("truncated header")
+    magic, version, record_size = HeaderStruct.unpack(data)
+    if magic != MAGIC:
+        raise BinaryLogError("not a DL24 binary log")
+    if version != VERSION or record_size != RECORD_SIZE:
+        raise BinaryLogError(f"unsupported binary log version {version}")
+
+
+class BinaryLogWriter:
+    def __init__(self, path: str, append: bool = False):
+        is_new = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+        if not is_new:
+            with open(path, "rb") as f:
+                read_header(f)
+            # drop a partially written last record
+            size = os.path.getsize(path)
+            valid_size = HEADER_SIZE + (size - HEADER_SIZE) // RECORD_SIZE * RECORD_SIZE
+            if valid_size != size:
+                os.truncate(path, valid_size)
+
+        self.file = open(path, "ab" if not is_new else "wb")
+        if is_new:
+            self.file.write(HeaderStruct.pack(MAGIC, VERSION, RECORD_SIZE))
+
+    def write(self, date: datetime.datetime, packet: BroadcastPacket, flags: int = 0):
+        self.write_values(datetime_to_timestamp(date), packet.voltage, packet.current, packet.energy, packet.capacity,
+                          packet.temperature, int(packet.time.total_seconds()), flags)
+
+    def write_values(self, timestamp: float, voltage: float, current: float, energy: float, charge: float,
+                     temperature: int, on_time: int, flags: int = 0):
+        self.file.write(RecordStruct.pack(timestamp, voltage, current, energy, charge, int(temperature), flags, int(on_time)))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+__all__ = [
+    "BinaryLogError",
+    "BinaryLogWriter",
+    "is_binary_log",
+]
@@ -0,0 +1,271 @@
+import time
+import struct
+import threading
+from typing import BinaryIO, List, Tuple
+
+import numpy as np
+
+from dl24 import BROADCAST_LENGTH, DL24, DL24Error
+from dl24.samples import SampleDtype
+
+# File layout: 16-byte header followed by variable-size chunk records, each one is a chunk header and the bytes
+# read from or written to the serial port. Timestamps are UTC seconds since 1970-01-01, the header holds the local
+# UTC offset at the start of the capture so decoded samples get the same wall clock dates as monitor logs.
+MAGIC = b"DL24CAP\x00"
+VERSION = 1
+
+HeaderStruct = struct.Struct("<8sHxxi")  # magic, version, UTC offset in seconds
+ChunkStruct = struct.Struct("<dBH")  # timestamp, direction, length
+ChunkLengthStruct = struct.Struct("<H")
+ChunkDirectionOffset = 8
+ChunkLengthOffset = 9
+ChunkTimestampBytes = np.arange(8)
+ChunkLengthBytes = np.arange(ChunkLengthOffset, ChunkLengthOffset + 2)
+
+HEADER_SIZE = HeaderStruct.size
+
+READ = 0
+WRITE = 1
+
+FlushInterval_s = 1
+InWaitingLimit = 4096  # bytes reported as waiting at most during a replay, like a driver buffer
+
+# Broadcast frame fields at their offsets from the start of the frame, see _parse_broadcast.
+# The 24-bit voltage is read as a 32-bit integer together with the preceding command byte and masked.
+BroadcastDtype = np.dtype({
+    "names": ["voltage", "current", "capacity", "energy", "temperature", "hours", "minutes", "seconds"],
+    "formats": [">u4", ">u2", ">u2", ">u2", "u1", "u1", "u1", "u1"],
+    "offsets": [3, 8, 11, 15, 25, 27, 28, 29],
+    "itemsize": BROADCAST_LENGTH,
+})
+
+ChunkIndexDtype = np.dtype([
+    ("timestamp", "<f8"),
+    ("direction", "u1"),
+    ("offset", "<i8"),  # of the chunk data
+    ("length", "<i8"),
+])
+
+
+class CaptureError(Exception):
+    pass
+
+
+class ReplayFinished(DL24Error):
+    def __init__(self):
+        super().__init__("end of capture")
+
+
+def is_capture(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class CaptureWriter:
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        self.file.write(HeaderStruct.pack(MAGIC, VERSION, time.localtime().tm_gmtoff))
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()  # the serial port may be read by another thread than the one closing the capture
+
+    def record_read(self, data: bytes):
+        self._write(READ, data)
+
+    def record_write(self, data: bytes):
+        self._write(WRITE, data)
+
+    def _write(self, direction: int, data: bytes):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(ChunkStruct.pack(time.time(), direction, len(data)) + data)
+            now = time.monotonic()
+            if now - self.last_flush >= FlushInterval_s:
+                self.file.flush()
+                self.last_flush = now
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_header(f: BinaryIO) -> int:
+    data = f.read(HEADER_SIZE)
+    if len(data) != HEADER_SIZE:
+        raise CaptureError("truncated header")
+    magic, version, utc_offset = HeaderStruct.unpack(data)
+    if magic != MAGIC:
+        raise CaptureError("not a DL24 capture")
+    if version != VERSION:
+        raise CaptureError(f"unsupported capture version {version}")
+    return utc_offset
+
+
+def _chunk_offsets(data: bytes) -> np.ndarray:
+    # offsets of all chunk headers, every offset depends on the length in the previous header
+    offsets = []
+    pos = 0
+    end = len(data) - ChunkStruct.size
+    while pos <= end:
+        offsets.append(pos)
+        pos += ChunkStruct.size + ChunkLengthStruct.unpack_from(data, pos + ChunkLengthOffset)[0]
+    return np.array(offsets, dtype=np.int64)
+
+
+def _load(path: str) -> Tuple[int, bytes, np.ndarray]:
+    # returns the UTC offset, the chunk data and a ChunkIndexDtype record per chunk,
+    # a partially written last chunk is ignored
+    with open(path, "rb") as f:
+        utc_offset = read_header(f)
+        data = f.read()
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    offsets = _chunk_offsets(data)
+    lengths = buf[offsets[:, None] + ChunkLengthBytes].view("<u2").ravel().astype(np.int64)
+    complete = offsets + ChunkStruct.size + lengths <= len(buf)
+    offsets, lengths = offsets[complete], lengths[complete]
+
+    index = np.zeros(len(offsets), dtype=ChunkIndexDtype)
+    index["timestamp"] = buf[offsets[:, None] + ChunkTimestampBytes].view("<f8").ravel()
+    index["direction"] = buf[offsets + ChunkDirectionOffset]
+    index["length"] = lengths
+    index["offset"] = offsets + ChunkStruct.size
+    return utc_offset, data, index
+
+
+def read_capture(path: str) -> Tuple[int, List[Tuple[float, int, bytes]]]:
+    # returns the UTC offset and the timestamp, direction and data of every chunk
+    utc_offset, data, index = _load(path)
+    return utc_offset, [(timestamp, direction, data[offset:offset + length])
+                        for timestamp, direction, offset, length in index.tolist()]
+
+
+def decode_broadcasts(data: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    # Finds all broadcast frames with a valid CRC in a byte stream at once. Returns their offsets and their
+    # decoded fields as a structured array of BroadcastDtype. Overlapping candidates are resolved like FrameDecoder
+    # does, the first valid frame wins.
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if len(buf) < BROADCAST_LENGTH:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=BroadcastDtype)
+
+    starts = np.flatnonzero((buf[:-1] == 0xff) & (buf[1:] == 0x55))
+    starts = starts[starts <= len(buf) - BROADCAST_LENGTH]
+
+    sums = np.concatenate([[0], np.cumsum(buf, dtype=np.int64)])
+    crc = ((sums[starts + BROADCAST_LENGTH - 1] - sums[starts + 2]) & 0xff) ^ 0x44
+    starts = starts[crc == buf[starts + BROADCAST_LENGTH - 1]]
+
+    if np.any(np.diff(starts) < BROADCAST_LENGTH):
+        kept = []
+        end = 0
+        for start in starts.tolist():
+            if start >= end:
+                kept.append(start)
+                end = start + BROADCAST_LENGTH
+        starts = np.array(kept, dtype=np.int64)
+
+    frames = buf[starts[:, None] + np.arange(BROADCAST_LENGTH)]
+    return starts, frames.view(BroadcastDtype).ravel()
+
+
+def decode_capture(path: str) -> Tuple[int, np.ndarray]:
+    # returns the UTC offset and one SampleDtype record per broadcast, stamped with the time of the read that completed it
+    utc_offset, data, index = _load(path)
+    reads = index[(index["direction"] == READ) & (index["length"] > 0)]
+
+    # gather the read bytes into one stream without going through every chunk in Python
+    ends = np.cumsum(reads["length"])
+    positions = np.arange(ends[-1] if len(ends) > 0 else 0) + np.repeat(reads["offset"] - (ends - reads["length"]), reads["length"])
+    data = np.frombuffer(data, dtype=np.uint8)[positions].tobytes()
+    times = reads["timestamp"]
+
+    starts, frames = decode_broadcasts(data)
+    samples = np.zeros(len(frames), dtype=SampleDtype)
+    samples["timestamp"] = times[np.searchsorted(ends, starts + BROADCAST_LENGTH - 1, side="right")]
+    samples["voltage"] = (frames["voltage"] & 0xffffff) / 10
+    samples["current"] = frames["current"] / 1000
+    samples["capacity"] = frames["capacity"].astype(np.float64) * 10 / 1000
+    samples["energy"] = frames["energy"].astype(np.float64) * 10
+    samples["temperature"] = frames["temperature"]
+    samples["time_seconds"] = frames["hours"].astype(np.uint32) * 3600 + frames["minutes"].astype(np.uint32) * 60 + frames["seconds"]
+    return utc_offset, samples
+
+
+class ReplaySerial:
+    # Stands in for serial.Serial and plays back the bytes read in a capture as fast as they are consumed. Bytes
+    # read after a captured write only become available once DL24 writes too, so a reply is not dropped as a stale
+    # one before its request is sent. Written data is compared with the captured writes, differences are only counted.
+    def __init__(self, path: str):
+        _, self.chunks = read_capture(path)
+        self.index = 0
+        self.offset = 0  # in the current read chunk
+        self.written = set()  # indexes of captured writes already matched by a write
+        self.timestamp = self.chunks[0][0] if self.chunks else 0.0
+        self.write_mismatches = 0
+
+    @property
+    def in_waiting(self) -> int:
+        count = 0
+        for i in range(self.index, len(self.chunks)):
+            _, direction, data = self.chunks[i]
+            if direction == WRITE:
+                if i in self.written:
+                    continue
+                break
+            count += len(data) - (self.offset if i == self.index else 0)
+            if count >= InWaitingLimit:
+                break
+        return count
+
+    def read(self, size: int = 1) -> bytes:
+        out = bytearray()
+        while len(out) < size and self.index < len(self.chunks):
+            timestamp, direction, data = self.chunks[self.index]
+            if direction == WRITE:
+                if self.index not in self.written:
+                    if len(out) > 0:
+                        break
+                    # the replayed code waits where the captured one wrote (e.g. a retry), skip the write to keep going
+                    self.write_mismatches += 1
+                self.index += 1
+                continue
+            taken = data[self.offset:self.offset + size - len(out)]
+            out += taken
+            self.offset += len(taken)
+            self.timestamp = timestamp
+            if self.offset >= len(data):
+                self.index += 1
+                self.offset = 0
+
+        if len(out) == 0 and self.index >= len(self.chunks):
+            raise ReplayFinished()
+        return bytes(out)
+
+    def write(self, data: bytes):
+        for i in range(self.index, len(self.chunks)):
+            if self.chunks[i][1] == WRITE and i not in self.written:
+                self.written.add(i)
+                if self.chunks[i][2] != bytes(data):
+                    self.write_mismatches += 1
+                return
+        self.write_mismatches += 1
+
+    def close(self):
+        pass
+
+
+def replay(path: str, **kwargs) -> DL24:
+    return DL24(path, transport=ReplaySerial(path), **kwargs)
+
+
+__all__ = [
+    "CaptureError",
+    "CaptureWriter",
+    "ReplayFinished",
+    "ReplaySerial",
+    "is_capture",
+    "read_capture",
+    "decode_broadcasts",
+    "decode_capture",
+    "replay",
+]
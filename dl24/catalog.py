@@ -0,0 +1,210 @@
+import os
+import sqlite3
+import datetime
+from dataclasses import dataclass, fields
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from dl24.dataset import LogPatterns, find_logs
+from dl24.rollup import load_raw
+
+SchemaVersion = 1
+
+Schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    error TEXT,
+    samples INTEGER,
+    start_time TEXT,
+    end_time TEXT,
+    duration REAL,
+    charge REAL,
+    energy REAL,
+    min_voltage REAL,
+    peak_temperature REAL
+);
+CREATE INDEX IF NOT EXISTS runs_start_time ON runs (start_time);
+CREATE INDEX IF NOT EXISTS runs_charge ON runs (charge);
+CREATE INDEX IF NOT EXISTS runs_energy ON runs (energy);
+CREATE INDEX IF NOT EXISTS runs_min_voltage ON runs (min_voltage);
+"""
+
+DefaultIndexPath = os.path.join(os.path.expanduser("~"), ".cache", "dl24", "catalog.sqlite")
+
+
+class CatalogError(Exception):
+    pass
+
+
+@dataclass
+class RunSummary:
+    path: str
+    samples: int
+    start_time: str  # local time, YYYY-MM-DD HH:MM:SS
+    end_time: str
+    duration: float  # s
+    charge: float  # Ah delivered, last minus first counter value as plotted by tools.plotter
+    energy: float  # Wh delivered
+    min_voltage: float  # V
+    peak_temperature: float  # celsius
+
+
+SummaryFields = [f.name for f in fields(RunSummary)]
+
+
+@dataclass
+class ScanResult:
+    added: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    failed: int = 0
+
+
+def _format_date(date: np.datetime64) -> str:
+    return str(date.astype("datetime64[s]")).replace("T", " ")
+
+
+def summarize(path: str) -> RunSummary:
+    # a rotated log is summarized together with its segments
+    dataset = load_raw(path)
+    if len(dataset) == 0:
+        raise CatalogError("empty log")
+    return RunSummary(
+            path=path,
+            samples=len(dataset),
+            start_time=_format_date(dataset.date[0]),
+            end_time=_format_date(dataset.date[-1]),
+            duration=float((dataset.date[-1] - dataset.date[0]) / np.timedelta64(1, "s")),
+            charge=float(dataset.charge[-1] - dataset.charge[0]),
+            energy=float(dataset.energy[-1] - dataset.energy[0]),
+            min_voltage=float(dataset.voltage.min()),
+            peak_temperature=float(dataset.temperature.max()),
+    )
+
+
+def _summarize_safe(path: str) -> Tuple[str, Optional[RunSummary], Optional[str]]:
+    try:
+        return path, summarize(path), None
+    except Exception as e:  # a broken log is recorded and skipped until it changes
+        return path, None, str(e) or type(e).__name__
+
+
+def open_catalog(path: str) -> sqlite3.Connection:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version not in (0, SchemaVersion):
+        conn.close()
+        raise CatalogError(f"unsupported catalog version {version}")
+    conn.executescript(Schema)
+    conn.execute(f"PRAGMA user_version = {SchemaVersion}")
+    return conn
+
+
+def scan(conn: sqlite3.Connection, directories: Sequence[str], patterns: Sequence[str] = LogPatterns,
+         jobs: int = 1, prune: bool = True) -> ScanResult:
+    # files are identified by path, modification time and size; only new or changed ones are read
+    directories = [os.path.abspath(x) for x in directories]
+    known = {path: (mtime_ns, size) for path, mtime_ns, size in conn.execute("SELECT path, mtime_ns, size FROM runs")}
+
+    result = ScanResult()
+    seen = set()
+    changed = {}
+    for path in find_logs(directories, patterns):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        seen.add(path)
+        state = (st.st_mtime_ns, st.st_size)
+        if known.get(path) == state:
+            result.unchanged += 1
+        else:
+            changed[path] = state
+
+    if jobs > 1 and len(changed) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(jobs) as executor:
+            summaries = list(executor.map(_summarize_safe, changed, chunksize=8))
+    else:
+        summaries = [_summarize_safe(path) for path in changed]
+
+    with conn:
+        for path, summary, error in summaries:
+            mtime_ns, size = changed[path]
+            if path in known:
+                result.updated += 1
+            else:
+                result.added += 1
+            if summary is None:
+                result.failed += 1
+                values = [path, None, None, None, None, None, None, None, None]
+            else:
+                values = [getattr(summary, x) for x in SummaryFields]
+            conn.execute(f"INSERT OR REPLACE INTO runs (mtime_ns, size, error, {', '.join(SummaryFields)}) "
+                         f"VALUES (?, ?, ?, {', '.join('?' * len(SummaryFields))})", [mtime_ns, size, error, *values])
+
+        if prune:
+            prefixes = tuple(os.path.join(x, "") for x in directories)
+            removed = [path for path in known if path.startswith(prefixes) and path not in seen]
+            conn.executemany("DELETE FROM runs WHERE path = ?", [(x,) for x in removed])
+            result.removed = len(removed)
+
+    return result
+
+
+def _format_datetime(value: datetime.datetime) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def query(conn: sqlite3.Connection, since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None,
+          min_charge: Optional[float] = None, max_charge: Optional[float] = None,
+          min_energy: Optional[float] = None, max_energy: Optional[float] = None,
+          voltage_below: Optional[float] = None, path_glob: Optional[str] = None,
+          sort: str = "start_time", descending: bool = False, limit: Optional[int] = None) -> List[RunSummary]:
+    if sort not in SummaryFields:
+        raise CatalogError(f"cannot sort by {sort}")
+
+    conditions = ["error IS NULL"]
+    params = []
+    for condition, value in [("start_time >= ?", since and _format_datetime(since)),
+                             ("start_time < ?", until and _format_datetime(until)),
+                             ("charge >= ?", min_charge),
+                             ("charge < ?", max_charge),
+                             ("energy >= ?", min_energy),
+                             ("energy < ?", max_energy),
+                             ("min_voltage < ?", voltage_below),
+                             ("path GLOB ?", path_glob)]:
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+
+    sql = f"SELECT {', '.join(SummaryFields)} FROM runs WHERE {' AND '.join(conditions)} " \
+          f"ORDER BY {sort} {'DESC' if descending else 'ASC'}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return [RunSummary(*row) for row in conn.execute(sql, params)]
+
+
+def failed_logs(conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+    return list(conn.execute("SELECT path, error FROM runs WHERE error IS NOT NULL ORDER BY path"))
+
+
+__all__ = [
+    "CatalogError",
+    "RunSummary",
+    "ScanResult",
+    "DefaultIndexPath",
+    "summarize",
+    "open_catalog",
+    "scan",
+    "query",
+    "failed_logs",
+]
@@ -0,0 +1,173 @@
+import os
+import json
+import stat
+import time
+import socket
+import datetime
+import collections
+from typing import Optional, List, Any, Sequence, Dict
+
+from dl24 import TIME, TIMER, BroadcastWaitTime_s, BaseDL24, DL24, BroadcastPacket, Metrics, \
+    DL24Error, DL24NoResponseError, DL24SerialError
+
+# Requests and responses are JSON objects, one per line:
+#   -> {"id": 1, "op": "read_value", "payload": [17, 0, 0], "timeout": 0.5}
+#   <- {"id": 1, "result": "002ee3"}
+#   <- {"id": 1, "error": "no_response", "message": "no response"}
+# After a "subscribe" request every broadcast is pushed as
+#   <- {"b": [voltage, current, capacity, energy, temperature, time_seconds]}
+
+BroadcastQueueSize = 64
+ReplyMargin_s = 0.5  # the daemon replies no_response itself at the deadline, this covers its queue and the socket
+
+
+def encode_value(value: Any) -> Any:
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    return value
+
+
+def decode_register_value(register: int, value: Any) -> Any:
+    if register in (TIME, TIMER):
+        return datetime.timedelta(seconds=value)
+    return value
+
+
+def encode_broadcast(packet: BroadcastPacket) -> List[Any]:
+    return [packet.voltage, packet.current, packet.capacity, packet.energy, packet.temperature, packet.time.total_seconds()]
+
+
+def decode_broadcast(data: List[Any]) -> BroadcastPacket:
+    return BroadcastPacket(voltage=data[0], current=data[1], capacity=data[2], energy=data[3], temperature=data[4],
+                           time=datetime.timedelta(seconds=data[5]))
+
+
+def encode_error(e: Exception) -> Dict[str, str]:
+    if isinstance(e, DL24NoResponseError):
+        return {"error": "no_response", "message": str(e)}
+    elif isinstance(e, DL24SerialError):
+        return {"error": "serial", "message": str(e)}
+    return {"error": "error", "message": str(e)}
+
+
+class DL24Client(BaseDL24):
+    def __init__(self, path: str):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(path)
+        except OSError as e:
+            self.sock.close()
+            raise DL24SerialError(e)
+
+        self._buffer = bytearray()
+        self._next_id = 1
+        self._subscribed = False
+        self._broadcasts: collections.deque = collections.deque(maxlen=BroadcastQueueSize)
+
+    def close(self):
+        self.sock.close()
+
+    def _send(self, message: Dict[str, Any]):
+        try:
+            self.sock.sendall(json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n")
+        except OSError as e:
+            raise DL24SerialError(e)
+
+    def _receive(self, deadline: Optional[float]) -> Dict[str, Any]:
+        while True:
+            end = self._buffer.find(b"\n")
+            if end >= 0:
+                line = bytes(self._buffer[:end])
+                del self._buffer[:end + 1]
+                return json.loads(line)
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DL24NoResponseError()
+                self.sock.settimeout(remaining)
+            else:
+                self.sock.settimeout(None)
+
+            try:
+                data = self.sock.recv(4096)
+            except socket.timeout:
+                raise DL24NoResponseError()
+            except OSError as e:
+                raise DL24SerialError(e)
+            if len(data) == 0:
+                raise DL24SerialError(ConnectionError("daemon closed the connection"))
+            self._buffer += data
+
+    def _call(self, op: str, deadline: Optional[float] = None, **kwargs) -> Any:
+        request_id = self._next_id
+        self._next_id += 1
+
+        message = {"id": request_id, "op": op, **kwargs}
+        if deadline is not None:
+            message["timeout"] = deadline - time.monotonic()
+        self._send(message)
+
+        while True:
+            response = self._receive(deadline + ReplyMargin_s if deadline is not None else None)
+            if "b" in response:
+                self._broadcasts.append(decode_broadcast(response["b"]))
+                continue
+            if response.get("id") != request_id:
+                continue
+
+            error = response.get("error")
+            if error == "no_response":
+                raise DL24NoResponseError()
+            elif error == "serial":
+                raise DL24SerialError(Exception(response["message"]))
+            elif error is not None:
+                raise DL24Error(response["message"])
+            return response.get("result")
+
+    def wait_for_broadcast(self, timeout: float = BroadcastWaitTime_s) -> BroadcastPacket:
+        if not self._subscribed:
+            self._call("subscribe")
+            self._subscribed = True
+
+        deadline = time.monotonic() + timeout
+        while len(self._broadcasts) == 0:
+            response = self._receive(deadline)
+            if "b" in response:
+                self._broadcasts.append(decode_broadcast(response["b"]))
+        return self._broadcasts.popleft()
+
+    def read_value(self, payload, deadline: Optional[float] = None) -> bytes:
+        return bytes.fromhex(self._call("read_value", deadline, payload=list(payload)))
+
+    def read_values(self, registers: Sequence[int], deadline: Optional[float] = None) -> List[Any]:
+        values = self._call("read_values", deadline, registers=list(registers))
+        return [decode_register_value(register, value) for register, value in zip(registers, values)]
+
+    def execute_command(self, command, payload, deadline: Optional[float] = None):
+        self._call("execute_command", deadline, command=command, payload=list(payload))
+
+    def _read_register(self, register: int) -> Any:
+        # goes through the daemon's settings cache
+        return self.read_values([register])[0]
+
+
+def is_daemon_socket(path: str) -> bool:
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def connect(path: str, metrics: Optional[Metrics] = None, capture=None) -> BaseDL24:
+    # capture is only possible with a directly opened serial port
+    if is_daemon_socket(path):
+        return DL24Client(path)
+    return DL24(path, metrics=metrics, capture=capture)
+
+
+__all__ = [
+    "DL24Client",
+    "connect",
+    "is_daemon_socket",
+]
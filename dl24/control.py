@@ -0,0 +1,166 @@
+import math
+import time
+from dataclasses import dataclass
+from typing import Optional, Callable
+
+from dl24 import BaseDL24, VOLTAGE, CURRENT, SETCURR, DL24NoResponseError, pack_decimal
+
+CurrentResolution = 0.01  # A, SETCURR takes hundredths of an ampere
+# Time for the measurement and the write of one iteration. Each request should get at least RetryPolicy.min_timeout,
+# a reply arriving after a shorter deadline could be taken as the reply to the next request.
+DefaultBudget_s = 0.5
+
+
+@dataclass
+class ControlSample:
+    time: float  # s, from the start of the loop
+    voltage: float  # V
+    current: float  # A, measured
+    setpoint: float  # A
+    achieved: Optional[float]  # W or ohm, None when it cannot be computed
+    error: Optional[float]  # achieved - target
+
+
+@dataclass
+class ControlStats:
+    iterations: int = 0
+    writes: int = 0
+    skipped_writes: int = 0
+    timeouts: int = 0
+    elapsed: float = 0.0  # s
+    error_count: int = 0
+    error_abs_sum: float = 0.0
+    error_square_sum: float = 0.0
+    error_abs_max: float = 0.0
+
+    @property
+    def rate(self) -> float:  # Hz
+        return self.iterations / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def mean_abs_error(self) -> float:
+        return self.error_abs_sum / self.error_count if self.error_count > 0 else float("nan")
+
+    @property
+    def rms_error(self) -> float:
+        return math.sqrt(self.error_square_sum / self.error_count) if self.error_count > 0 else float("nan")
+
+    def add_error(self, error: float):
+        self.error_count += 1
+        self.error_abs_sum += abs(error)
+        self.error_square_sum += error * error
+        self.error_abs_max = max(self.error_abs_max, abs(error))
+
+
+class ControlLoop:
+    # Constant power / constant resistance on top of the constant current mode. Every iteration measures voltage
+    # and current (one pipelined request, or a broadcast), computes the current setpoint and writes it only if it
+    # differs after rounding to the device resolution. Requests are bounded by a per-iteration budget instead of
+    # a full retry cycle, a missed reply just makes the next iteration measure or write again. With broadcasts as the
+    # source an iteration waits for the next one (about one per second) and the budget only covers the write.
+    Modes = ("power", "resistance")
+
+    def __init__(self, dl24: BaseDL24, mode: str, target: float, max_current: float, source: str = "poll",
+                 gain: float = 1.0, budget: float = DefaultBudget_s, period: float = 0.0, min_voltage: float = 0.5):
+        if mode not in self.Modes:
+            raise ValueError(f"unknown mode {mode}")
+        if target <= 0:
+            raise ValueError("target must be positive")
+
+        self.dl24 = dl24
+        self.mode = mode
+        self.target = target
+        self.max_current = max_current
+        self.source = source
+        self.gain = gain
+        self.budget = budget  # s
+        self.period = period  # s, minimum iteration time
+        self.min_voltage = min_voltage  # V, below it the load is set to 0 A
+
+        self.stats = ControlStats()
+        self.setpoint = 0.0
+        self.written: Optional[float] = None
+        self.start = None
+
+    def current_for(self, voltage: float) -> float:
+        if voltage < self.min_voltage:
+            return 0.0
+        if self.mode == "power":
+            return self.target / voltage
+        return voltage / self.target
+
+    def achieved(self, voltage: float, current: float) -> Optional[float]:
+        if self.mode == "power":
+            return voltage * current
+        return voltage / current if current > 0 else None
+
+    def _measure(self, deadline: float):
+        if self.source == "broadcast":
+            packet = self.dl24.wait_for_broadcast()
+            return packet.voltage, packet.current
+        voltage, current = self.dl24.read_values([VOLTAGE, CURRENT], deadline)
+        return voltage, current
+
+    def _write(self, setpoint: float, deadline: float):
+        setpoint = round(setpoint / CurrentResolution) * CurrentResolution
+        if self.written is not None and abs(setpoint - self.written) < CurrentResolution / 2:
+            self.stats.skipped_writes += 1
+            return
+
+        self.written = None  # unknown until acknowledged
+        self.dl24.execute_command(SETCURR, pack_decimal(setpoint), deadline)
+        self.written = setpoint
+        self.stats.writes += 1
+
+    def step(self) -> Optional[ControlSample]:
+        started = time.monotonic()
+        deadline = started + self.budget
+        tracking = self.written is not None  # the measurement reflects a setpoint written by an earlier iteration
+        self.stats.iterations += 1
+        try:
+            voltage, current = self._measure(deadline)
+            if self.source == "broadcast":
+                deadline = time.monotonic() + self.budget
+            desired = min(self.max_current, max(0.0, self.current_for(voltage)))
+            self.setpoint += self.gain * (desired - self.setpoint)
+            self._write(self.setpoint, deadline)
+        except DL24NoResponseError:
+            self.stats.timeouts += 1
+            return None
+        finally:
+            if self.period > 0:
+                remaining = started + self.period - time.monotonic()
+                if remaining > 0:
+                    time.sleep(remaining)
+            self.stats.elapsed = time.monotonic() - self.start
+
+        achieved = self.achieved(voltage, current)
+        error = achieved - self.target if achieved is not None else None
+        if error is not None and tracking:
+            self.stats.add_error(error)
+        return ControlSample(started - self.start, voltage, current, self.setpoint, achieved, error)
+
+    def run(self, duration: Optional[float] = None, on_sample: Optional[Callable[[ControlSample], None]] = None,
+            should_stop: Optional[Callable[[], bool]] = None):
+        self.start = time.monotonic()
+        enabled = False
+        try:
+            while duration is None or time.monotonic() - self.start < duration:
+                if should_stop is not None and should_stop():
+                    break
+                sample = self.step()
+                if not enabled and self.written is not None:
+                    self.dl24.enable()
+                    enabled = True
+                if sample is not None and on_sample is not None:
+                    on_sample(sample)
+        finally:
+            if enabled:
+                self.dl24.disable()
+
+
+__all__ = [
+    "ControlSample",
+    "ControlStats",
+    "ControlLoop",
+]
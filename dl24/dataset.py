@@ -0,0 +1,296 @@
+import io
+import csv
+import os
+import fnmatch
+import warnings
+from dataclasses import dataclass
+from typing import Union, List, Sequence, Iterator
+
+import numpy as np
+
+from dl24.binlog import MAGIC, HEADER_SIZE, RECORD_SIZE, BinaryLogWriter, BinaryLogError, is_binary_log, read_header
+from dl24.capture import is_capture, decode_capture
+from dl24.segments import segment_parent
+
+RecordDtype = np.dtype([
+    ("timestamp", "<f8"),
+    ("voltage", "<f4"),
+    ("current", "<f4"),
+    ("energy", "<f4"),
+    ("charge", "<f4"),
+    ("temperature", "<i2"),
+    ("flags", "<u2"),
+    ("on_time", "<u4"),
+])
+assert RecordDtype.itemsize == RECORD_SIZE
+
+LogPatterns = ("*.csv", "*.bin")
+
+CSV_HEADER = ['date', 'voltage', 'current', 'power', 'energy', 'charge', 'temp', 'time_seconds', 'time_str']
+
+
+@dataclass
+class Dataset:
+    date: np.ndarray  # datetime64[ms] from every loader, local wall clock time
+    voltage: np.ndarray  # V
+    current: np.ndarray  # A
+    power: np.ndarray  # W
+    energy: np.ndarray  # Wh
+    charge: np.ndarray  # Ah
+    temperature: np.ndarray  # celsius
+    time_seconds: np.ndarray
+
+    def __len__(self):
+        return len(self.date)
+
+    @property
+    def elapsed_hours(self) -> np.ndarray:
+        if len(self.date) == 0:
+            return np.zeros(0)
+        return (self.date - self.date[0]) / np.timedelta64(1, "h")
+
+
+CsvDtype = np.dtype([("date", "U19")] + [(x, "<f8") for x in
+                     ("voltage", "current", "power", "energy", "charge", "temperature", "time_seconds")])
+
+
+def _parse_csv(source: Union[str, List[str]], skiprows: int) -> Dataset:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)  # empty log
+        rows = np.loadtxt(source, delimiter=",", skiprows=skiprows, usecols=range(len(CsvDtype)), dtype=CsvDtype, ndmin=1)
+
+    return Dataset(date=rows["date"].astype("datetime64[ms]"), **{x: rows[x] for x in CsvDtype.names[1:]})
+
+
+def load_csv(path: str) -> Dataset:
+    return _parse_csv(path, 1)
+
+
+def open_binary_log(path: str) -> np.ndarray:
+    with open(path, "rb") as f:
+        read_header(f)
+    count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_SIZE
+    if count == 0:
+        return np.zeros(0, dtype=RecordDtype)
+    return np.memmap(path, dtype=RecordDtype, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+def _records_to_dataset(records: np.ndarray) -> Dataset:
+    voltage = records["voltage"].astype(np.float64)
+    current = records["current"].astype(np.float64)
+    return Dataset(
+            date=(records["timestamp"] * 1000).astype(np.int64).astype("datetime64[ms]"),
+            voltage=voltage,
+            current=current,
+            power=voltage * current,
+            energy=records["energy"].astype(np.float64),
+            charge=records["charge"].astype(np.float64),
+            temperature=records["temperature"].astype(np.float64),
+            time_seconds=records["on_time"].astype(np.float64),
+    )
+
+
+def load_binary_log(path: str) -> Dataset:
+    return _records_to_dataset(open_binary_log(path))
+
+
+def samples_to_dataset(samples: np.ndarray, utc_offset: int = 0) -> Dataset:
+    # samples of dl24.samples.SampleDtype with UTC timestamps, dates are shifted by utc_offset seconds
+    voltage = samples["voltage"].astype(np.float64)
+    current = samples["current"].astype(np.float64)
+    return Dataset(
+            date=((samples["timestamp"] + utc_offset) * 1000).astype(np.int64).astype("datetime64[ms]"),
+            voltage=voltage,
+            current=current,
+            power=voltage * current,
+            energy=samples["energy"].astype(np.float64),
+            charge=samples["capacity"].astype(np.float64),
+            temperature=samples["temperature"].astype(np.float64),
+            time_seconds=samples["time_seconds"].astype(np.float64),
+    )
+
+
+def load_capture(path: str) -> Dataset:
+    utc_offset, samples = decode_capture(path)
+    return samples_to_dataset(samples, utc_offset)
+
+
+def load_log(path: str) -> Dataset:
+    if is_binary_log(path):
+        return load_binary_log(path)
+    if is_capture(path):
+        return load_capture(path)
+    return load_csv(path)
+
+
+def find_logs(directories: Sequence[str], patterns: Sequence[str] = LogPatterns) -> Iterator[str]:
+    # rotated segments are left out when the log they were rotated from exists, they are part of its run
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                if any(fnmatch.fnmatch(name, p) for p in patterns):
+                    parent = segment_parent(name)
+                    if parent is not None and parent in files:
+                        continue
+                    yield os.path.join(root, name)
+
+
+def format_time_str(seconds: np.ndarray):
+    return [f"{x // 86400:01d}d {x // 3600 % 24:02d}:{x // 60 % 60:02d}:{x % 60:02d}" for x in seconds.astype(np.int64).tolist()]
+
+
+def save_csv(dataset: Dataset, path: str):
+    dates = np.char.replace(np.datetime_as_string(dataset.date.astype("datetime64[s]"), unit="s"), "T", " ")
+    columns = [
+        dates,
+        np.char.mod("%.2f", dataset.voltage),
+        np.char.mod("%.2f", dataset.current),
+        np.char.mod("%.2f", dataset.voltage * dataset.current),
+        np.char.mod("%.2f", dataset.energy),
+        np.char.mod("%.2f", dataset.charge),
+        np.char.mod("%.0f", dataset.temperature),
+        np.char.mod("%d", dataset.time_seconds.astype(np.int64)),
+        format_time_str(dataset.time_seconds),
+    ]
+    with open(path, "w", newline="") as f:
+        wr = csv.writer(f)
+        wr.writerow(CSV_HEADER)
+        wr.writerows(zip(*columns))
+
+
+def save_binary_log(dataset: Dataset, path: str):
+    records = np.zeros(len(dataset), dtype=RecordDtype)
+    records["timestamp"] = dataset.date.astype("datetime64[ms]").astype(np.int64) / 1000
+    records["voltage"] = dataset.voltage
+    records["current"] = dataset.current
+    records["energy"] = dataset.energy
+    records["charge"] = dataset.charge
+    records["temperature"] = np.round(dataset.temperature)
+    records["on_time"] = dataset.time_seconds
+
+    writer = BinaryLogWriter(path)
+    writer.file.write(records.tobytes())
+    writer.close()
+
+
+def downsample_minmax(x: np.ndarray, y: np.ndarray, buckets: int):
+    # keeps the minimum and the maximum of each bucket in their original order, so short sags and steps stay visible
+    n = len(x)
+    if buckets <= 0 or n <= buckets * 2:
+        return x, y
+
+    size = -(-n // buckets)
+    buckets = -(-n // size)
+    padded = np.pad(y, (0, buckets * size - n), mode="edge").reshape(buckets, size)
+
+    offsets = np.arange(buckets) * size
+    idx_min = np.minimum(padded.argmin(axis=1) + offsets, n - 1)
+    idx_max = np.minimum(padded.argmax(axis=1) + offsets, n - 1)
+
+    idx = np.sort(np.stack([idx_min, idx_max], axis=1), axis=1).ravel()
+    return x[idx], y[idx]
+
+
+class LogTail:
+    # reads the rows appended to a CSV or binary log since the previous call, a partially written last row is left for the next one
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        self.binary = None
+
+    def read(self) -> Dataset:
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = 0
+        if size < self.offset:  # the log was replaced
+            self.offset = 0
+            self.binary = None
+
+        data = b""
+        if size > self.offset:
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                data = f.read(size - self.offset)
+
+        if self.binary is None:
+            if len(data) < len(MAGIC):
+                return _parse_csv([], 0)
+            self.binary = data.startswith(MAGIC)
+
+        if self.binary:
+            start = 0
+            if self.offset == 0:
+                if len(data) < HEADER_SIZE:
+                    return _records_to_dataset(np.zeros(0, dtype=RecordDtype))
+                read_header(io.BytesIO(data[:HEADER_SIZE]))
+                start = HEADER_SIZE
+            count = (len(data) - start) // RECORD_SIZE
+            records = np.frombuffer(data, dtype=RecordDtype, count=count, offset=start)
+            self.offset += start + count * RECORD_SIZE
+            return _records_to_dataset(records)
+
+        end = data.rfind(b"\n") + 1
+        lines = data[:end].decode("utf-8").splitlines()
+        skiprows = 1 if self.offset == 0 else 0
+        self.offset += end
+        return _parse_csv(lines[skiprows:], 0)
+
+
+class IncrementalMinMax:
+    # min/max decimation of a growing series: every bucket of bucket_size samples keeps its minimum and maximum,
+    # adjacent buckets are merged when there are more than max_buckets of them, so appending costs O(new samples)
+    def __init__(self, max_buckets: int):
+        self.max_buckets = max(1, max_buckets)
+        self.bucket_size = 1
+        self.x = np.zeros((0, 2))
+        self.y = np.zeros((0, 2))
+        self.pending_x = np.zeros(0)
+        self.pending_y = np.zeros(0)
+
+    @staticmethod
+    def _reduce(x: np.ndarray, y: np.ndarray):
+        rows = np.arange(len(y))
+        idx = np.sort(np.stack([y.argmin(axis=1), y.argmax(axis=1)], axis=1), axis=1)
+        return x[rows[:, None], idx], y[rows[:, None], idx]
+
+    def extend(self, x: np.ndarray, y: np.ndarray):
+        x = np.concatenate([self.pending_x, x])
+        y = np.concatenate([self.pending_y, y])
+        full = len(x) // self.bucket_size * self.bucket_size
+        if full > 0:
+            bx, by = self._reduce(x[:full].reshape(-1, self.bucket_size), y[:full].reshape(-1, self.bucket_size))
+            self.x = np.concatenate([self.x, bx])
+            self.y = np.concatenate([self.y, by])
+        self.pending_x = x[full:]
+        self.pending_y = y[full:]
+
+        while len(self.x) > self.max_buckets:
+            merged = len(self.x) // 2 * 2
+            mx, my = self._reduce(self.x[:merged].reshape(-1, 4), self.y[:merged].reshape(-1, 4))
+            self.x = np.concatenate([mx, self.x[merged:]])
+            self.y = np.concatenate([my, self.y[merged:]])
+            self.bucket_size *= 2
+
+    def series(self):
+        return np.concatenate([self.x.ravel(), self.pending_x]), np.concatenate([self.y.ravel(), self.pending_y])
+
+
+__all__ = [
+    "RecordDtype",
+    "BinaryLogError",
+    "Dataset",
+    "load_csv",
+    "load_binary_log",
+    "load_capture",
+    "samples_to_dataset",
+    "load_log",
+    "find_logs",
+    "open_binary_log",
+    "save_csv",
+    "save_binary_log",
+    "downsample_minmax",
+    "LogTail",
+    "IncrementalMinMax",
+]
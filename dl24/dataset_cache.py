@@ -0,0 +1,118 @@
+import os
+import struct
+import hashlib
+import logging
+from typing import Optional
+
+import numpy as np
+
+from dl24.binlog import is_binary_log
+from dl24.dataset import Dataset, load_log
+
+logger = logging.getLogger("dl24.dataset_cache")
+
+# One file per cached log, named after a hash of its absolute path: a header with the modification time and size
+# of the log when it was parsed, then the Dataset columns one after another, dates as int64 milliseconds and the
+# other columns as float64. An entry is only used while the log still has the same modification time and size.
+# Reading an entry touches it, the least recently used entries are removed once the cache grows above its limit.
+MAGIC = b"DL24DSC\x00"
+VERSION = 1
+
+HeaderStruct = struct.Struct("<8sHxxqqq")  # magic, version, log mtime in ns, log size, sample count
+
+HEADER_SIZE = HeaderStruct.size
+ENTRY_SUFFIX = ".dlds"
+
+DefaultCacheDir = os.path.join(os.path.expanduser("~"), ".cache", "dl24", "datasets")
+DefaultCacheSize_MB = 1024
+
+ValueFields = [x for x in Dataset.__dataclass_fields__ if x != "date"]
+
+
+class DatasetCache:
+    def __init__(self, directory: str = DefaultCacheDir, max_bytes: int = DefaultCacheSize_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def entry_path(self, path: str) -> str:
+        key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, path: str, st: Optional[os.stat_result] = None) -> Optional[Dataset]:
+        if st is None:
+            st = os.stat(path)
+        entry = self.entry_path(path)
+        try:
+            with open(entry, "rb") as f:
+                header = f.read(HEADER_SIZE)
+                if len(header) != HEADER_SIZE:
+                    return None
+                magic, version, mtime_ns, size, count = HeaderStruct.unpack(header)
+                if magic != MAGIC or version != VERSION or mtime_ns != st.st_mtime_ns or size != st.st_size:
+                    return None
+                dates = np.fromfile(f, dtype="<i8", count=count)
+                values = np.fromfile(f, dtype="<f8", count=count * len(ValueFields))
+            os.utime(entry)
+        except OSError:
+            return None
+        if len(dates) != count or len(values) != count * len(ValueFields):
+            return None
+
+        values = values.reshape(len(ValueFields), count)
+        return Dataset(date=dates.astype("datetime64[ms]"), **{x: values[i] for i, x in enumerate(ValueFields)})
+
+    def put(self, path: str, st: os.stat_result, dataset: Dataset):
+        # st is the state of the log before it was parsed, so rows appended meanwhile invalidate the entry
+        if HEADER_SIZE + len(dataset) * 8 * (len(ValueFields) + 1) > self.max_bytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        entry = self.entry_path(path)
+        tmp_path = f"{entry}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HeaderStruct.pack(MAGIC, VERSION, st.st_mtime_ns, st.st_size, len(dataset)))
+            f.write(dataset.date.astype("datetime64[ms]").astype("<i8").tobytes())
+            for field in ValueFields:
+                f.write(np.asarray(getattr(dataset, field), dtype="<f8").tobytes())
+        os.replace(tmp_path, entry)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for x in it:
+                if x.name.endswith(ENTRY_SUFFIX):
+                    try:
+                        st = x.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, x.path))
+
+        total = 0
+        for _, size, path in sorted(entries, reverse=True):
+            total += size
+            if total > self.max_bytes:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def load(self, path: str) -> Dataset:
+        # load_log through the cache, binary logs are memory mapped and loaded directly
+        if is_binary_log(path):
+            return load_log(path)
+        st = os.stat(path)
+        dataset = self.get(path, st)
+        if dataset is None:
+            dataset = load_log(path)
+            try:
+                self.put(path, st, dataset)
+            except OSError as e:
+                logger.warning("cannot cache %s: %s", path, e)
+        return dataset
+
+
+__all__ = [
+    "DefaultCacheDir",
+    "DefaultCacheSize_MB",
+    "DatasetCache",
+]
@@ -0,0 +1,280 @@
+import os
+import tty
+import time
+import random
+import select
+import struct
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Optional, List, Tuple
+
+from dl24 import IS_ON, VOLTAGE, CURRENT, TIME, CAP_AH, CAP_WH, TEMP, LIM_CURR, LIM_VOLT, TIMER, \
+    OUTPUT, SETCURR, SETVCUT, SETTMR, RESET_COUNTERS
+from dl24.crc import calc_crc_for_payload
+
+logger = logging.getLogger("dl24.emulator")
+
+
+def pack_uint24(value: int) -> bytes:
+    return struct.pack(">I", max(0, min(int(value), 0xffffff)))[1:]
+
+
+def pack_time(seconds: float) -> bytes:
+    seconds = int(seconds)
+    return bytes([min(seconds // 3600, 0xff), (seconds // 60) % 60, seconds % 60])
+
+
+@dataclass
+class BatteryModel:
+    capacity: float = 100  # Ah
+    full_voltage: float = 12.8  # V
+    empty_voltage: float = 10.0  # V
+    internal_resistance: float = 0.02  # ohm
+    discharged: float = 0  # Ah
+
+    @property
+    def state_of_charge(self) -> float:
+        return max(0.0, 1 - self.discharged / self.capacity)
+
+    def open_circuit_voltage(self) -> float:
+        soc = self.state_of_charge
+        return self.empty_voltage + (self.full_voltage - self.empty_voltage) * (1 - (1 - soc) ** 4)
+
+    def voltage(self, current: float) -> float:
+        return max(0.0, self.open_circuit_voltage() - current * self.internal_resistance)
+
+    def discharge(self, current: float, dt: float):
+        self.discharged += current * dt / 3600
+
+
+class DeviceModel:
+    def __init__(self, battery: BatteryModel, ambient_temperature: float = 25):
+        self.battery = battery
+        self.ambient_temperature = ambient_temperature
+
+        self.is_on = False
+        self.current_limit = 0.0  # A
+        self.voltage_cutoff = 0.0  # V
+        self.timer = 0  # s
+
+        self.charge = 0.0  # Ah
+        self.energy = 0.0  # Wh
+        self.on_time = 0.0  # s
+        self.temperature = ambient_temperature
+
+    @property
+    def current(self) -> float:
+        if not self.is_on or self.battery.state_of_charge <= 0:
+            return 0.0
+        return self.current_limit
+
+    @property
+    def voltage(self) -> float:
+        return self.battery.voltage(self.current)
+
+    def step(self, dt: float):
+        current = self.current
+        voltage = self.voltage
+
+        if current > 0:
+            self.battery.discharge(current, dt)
+            self.charge += current * dt / 3600
+            self.energy += current * voltage * dt / 3600
+            self.on_time += dt
+
+            if voltage < self.voltage_cutoff or self.battery.state_of_charge <= 0:
+                self.is_on = False
+            if self.timer > 0 and self.on_time >= self.timer:
+                self.is_on = False
+
+        target_temperature = self.ambient_temperature + current * voltage * 0.15
+        self.temperature += (target_temperature - self.temperature) * min(1.0, dt / 60)
+
+    def read_value(self, register: int) -> Optional[bytes]:
+        if register == IS_ON:
+            return bytes([0, 0, 1 if self.is_on else 0])
+        elif register == VOLTAGE:
+            return pack_uint24(round(self.voltage * 1000))
+        elif register == CURRENT:
+            return pack_uint24(round(self.current * 1000))
+        elif register == TIME:
+            return pack_time(self.on_time)
+        elif register == CAP_AH:
+            return pack_uint24(round(self.charge * 1000))
+        elif register == CAP_WH:
+            return pack_uint24(round(self.energy * 1000))
+        elif register == TEMP:
+            return pack_uint24(round(self.temperature))
+        elif register == LIM_CURR:
+            return b'\x00' + struct.pack(">H", round(self.current_limit * 100))
+        elif register == LIM_VOLT:
+            return b'\x00' + struct.pack(">H", round(self.voltage_cutoff * 100))
+        elif register == TIMER:
+            return pack_time(self.timer)[:2] + b'\x00'
+        return None
+
+    def execute_command(self, command: int, payload: bytes) -> bool:
+        if command == OUTPUT:
+            self.is_on = payload[0] == 1
+        elif command == SETCURR:
+            self.current_limit = payload[0] + payload[1] / 100
+        elif command == SETVCUT:
+            self.voltage_cutoff = payload[0] + payload[1] / 100
+        elif command == SETTMR:
+            self.timer = struct.unpack(">H", payload)[0]
+        elif command == RESET_COUNTERS:
+            self.charge = 0.0
+            self.energy = 0.0
+            self.on_time = 0.0
+        else:
+            return False
+        return True
+
+    def build_broadcast(self) -> bytes:
+        payload = bytes([0x01, 0x02]) + \
+                  pack_uint24(round(self.voltage * 10)) + \
+                  pack_uint24(round(self.current * 1000)) + \
+                  pack_uint24(round(self.charge * 100)) + \
+                  struct.pack(">I", round(self.energy / 10)) + \
+                  bytes(8) + \
+                  bytes([min(round(self.temperature), 0xff), 0x00]) + \
+                  pack_time(self.on_time) + \
+                  bytes([0x3c, 0, 0, 0, 0])
+        return b'\xff\x55' + payload + bytes([calc_crc_for_payload(payload)])
+
+
+class DL24Emulator:
+    def __init__(self, device: Optional[DeviceModel] = None, speed: float = 1.0, broadcast_interval: float = 1.0,
+                 noise: float = 0.0, drop: float = 0.0, latency: float = 0.0, seed: Optional[int] = None):
+        self.device = device or DeviceModel(BatteryModel())
+        self.speed = speed
+        self.broadcast_interval = broadcast_interval
+        self.noise = noise
+        self.drop = drop
+        self.latency = latency
+        self.random = random.Random(seed)
+
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+
+        self.frames_received = 0
+        self.broadcasts_sent = 0
+        self.reply_fault: Optional[str] = None
+
+        self._rx = bytearray()
+        self._pending: List[Tuple[float, bytes]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def close(self):
+        self.stop()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def _send(self, data: bytes):
+        out = bytearray()
+        for b in data:
+            if self.drop > 0 and self.random.random() < self.drop:
+                continue
+            if self.noise > 0 and self.random.random() < self.noise:
+                b ^= 1 << self.random.randrange(8)
+            out.append(b)
+        if len(out) > 0:
+            os.write(self.master_fd, out)
+
+    def inject_reply_fault(self, kind: str):
+        assert kind in ("drop", "corrupt")
+        self.reply_fault = kind
+
+    def _reply(self, data: bytes, now: float):
+        fault, self.reply_fault = self.reply_fault, None
+        if fault == "drop":
+            return
+        elif fault == "corrupt":
+            data = bytes([data[0] ^ 0xff, *data[1:]])
+
+        if self.latency > 0:
+            self._pending.append((now + self.latency, data))
+        else:
+            self._send(data)
+
+    def _handle_frame(self, frame: bytes, now: float):
+        self.frames_received += 1
+        code = frame[2]
+        with self._lock:
+            if code >= IS_ON:
+                value = self.device.read_value(code)
+                if value is not None:
+                    self._reply(b'\xca\xcb' + value + b'\xce\xcf', now)
+            elif self.device.execute_command(code, frame[3:5]):
+                self._reply(b'\x6f', now)
+
+    def _process_input(self, now: float):
+        rx = self._rx
+        while len(rx) >= 6:
+            start = rx.find(b'\xb1\xb2')
+            if start < 0:
+                del rx[:-1]
+                return
+            del rx[:start]
+            if len(rx) < 6:
+                return
+            if rx[5] != 0xb6:
+                del rx[:1]
+                continue
+            self._handle_frame(bytes(rx[:6]), now)
+            del rx[:6]
+
+    def run(self):
+        last_step = time.monotonic()
+        next_broadcast = last_step
+
+        while not self._stop.is_set():
+            now = time.monotonic()
+
+            with self._lock:
+                self.device.step((now - last_step) * self.speed)
+            last_step = now
+
+            if now >= next_broadcast:
+                with self._lock:
+                    frame = self.device.build_broadcast()
+                self._send(frame)
+                self.broadcasts_sent += 1
+                next_broadcast += self.broadcast_interval
+                if next_broadcast < now:
+                    next_broadcast = now + self.broadcast_interval
+
+            due = [x for x in self._pending if x[0] <= now]
+            if len(due) > 0:
+                self._pending = [x for x in self._pending if x[0] > now]
+                for _, data in due:
+                    self._send(data)
+
+            deadline = min([next_broadcast] + [x[0] for x in self._pending])
+            readable, _, _ = select.select([self.master_fd], [], [], max(0.0, min(deadline - now, 0.1)))
+            if readable:
+                try:
+                    self._rx += os.read(self.master_fd, 1024)
+                except OSError:
+                    continue
+                self._process_input(time.monotonic())
+
+
+__all__ = [
+    "BatteryModel",
+    "DeviceModel",
+    "DL24Emulator",
+]
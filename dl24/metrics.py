@@ -0,0 +1,113 @@
+import bisect
+import threading
+from typing import Dict, Tuple, List, Callable
+
+LatencyBuckets_s = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LatencyBuckets_s):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self):
+        self.frames: Dict[str, int] = {"broadcast": 0, "value": 0, "ack": 0}
+        self.crc_failures = 0
+        self.discarded_bytes = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.serial_errors = 0
+        self.latency: Dict[Tuple[str, int], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe_latency(self, kind: str, code: int, value: float):
+        histogram = self.latency.get((kind, code))
+        if histogram is None:
+            with self._lock:
+                histogram = self.latency.setdefault((kind, code), Histogram())
+        histogram.observe(value)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if len(labels) == 0:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels.keys(), escaped)) + "}"
+
+
+def render_metrics(devices: Dict[str, Metrics]) -> str:
+    lines: List[str] = []
+
+    def family(name: str, type_: str, help_: str, samples: List[Tuple[str, Dict[str, str], float]]):
+        lines.append(f"# HELP {name} {help_}")
+        lines.append(f"# TYPE {name} {type_}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{_format_labels(labels)} {value if isinstance(value, int) else repr(float(value))}")
+
+    family("dl24_frames_total", "counter", "Frames decoded from the serial link.",
+           [("", {"device": d, "type": t}, v) for d, m in devices.items() for t, v in m.frames.items()])
+
+    for attr, help_ in [("crc_failures", "Broadcast frames with an invalid CRC."),
+                        ("discarded_bytes", "Bytes skipped while searching for a frame header."),
+                        ("retries", "Requests sent again after a missing reply."),
+                        ("timeouts", "Replies that did not arrive in time."),
+                        ("serial_errors", "Serial port errors.")]:
+        family(f"dl24_{attr}_total", "counter", help_, [("", {"device": d}, getattr(m, attr)) for d, m in devices.items()])
+
+    samples = []
+    for d, m in devices.items():
+        with m._lock:
+            latency = list(m.latency.items())
+        for (kind, code), histogram in sorted(latency):
+            labels = {"device": d, "request": kind, "code": f"0x{code:02x}"}
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                samples.append(("_bucket", {**labels, "le": f"{bound:g}"}, cumulative))
+            samples.append(("_bucket", {**labels, "le": "+Inf"}, histogram.count))
+            samples.append(("_sum", labels, histogram.sum))
+            samples.append(("_count", labels, histogram.count))
+    family("dl24_request_latency_seconds", "histogram", "Time from sending a request to receiving its reply.", samples)
+
+    return "\n".join(lines) + "\n"
+
+
+def serve_metrics(address: str, port: int, devices: Callable[[], Dict[str, Metrics]]):
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render_metrics(devices()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+__all__ = [
+    "Histogram",
+    "Metrics",
+    "render_metrics",
+    "serve_metrics",
+]
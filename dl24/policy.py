@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional
+
+
+@dataclass
+class RttStats:
+    srtt: Optional[float]  # s
+    rttvar: Optional[float]  # s
+    timeout: float  # s
+    samples: int
+    timeouts: int
+
+
+class RttEstimator:
+    # smoothed round-trip time and its variation as in RFC 6298
+    Alpha = 1 / 8
+    Beta = 1 / 4
+
+    def __init__(self):
+        self.srtt: Optional[float] = None
+        self.rttvar: Optional[float] = None
+        self.samples = 0
+        self.timeouts = 0
+        self.backoff = 1.0
+
+    def observe(self, rtt: float):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.Beta) * self.rttvar + self.Beta * abs(self.srtt - rtt)
+            self.srtt = (1 - self.Alpha) * self.srtt + self.Alpha * rtt
+        self.samples += 1
+        self.backoff = 1.0
+
+
+class RetryPolicy:
+    # Replies carry no register tag, so a reply arriving just after its request timed out would be taken as the reply
+    # to the next request. min_timeout keeps a margin above the device's slowest replies for that reason.
+    def __init__(self, initial_timeout: float = 1.0, min_timeout: float = 0.25, max_timeout: float = 2.0,
+                 retries: int = 4, backoff_factor: float = 2.0, variance_factor: float = 4.0):
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.variance_factor = variance_factor
+        self.estimators: Dict[Hashable, RttEstimator] = {}
+        self.overall = RttEstimator()  # used for keys that have no samples of their own yet
+
+    def _estimator(self, key: Hashable) -> RttEstimator:
+        estimator = self.estimators.get(key)
+        if estimator is None:
+            estimator = self.estimators[key] = RttEstimator()
+        return estimator
+
+    def _base_timeout(self, estimator: RttEstimator) -> float:
+        if estimator.srtt is None:
+            estimator = self.overall
+        if estimator.srtt is None:
+            return self.initial_timeout
+        return estimator.srtt + self.variance_factor * estimator.rttvar
+
+    def timeout(self, key: Hashable) -> float:
+        estimator = self._estimator(key)
+        timeout = self._base_timeout(estimator) * estimator.backoff
+        return min(self.max_timeout, max(self.min_timeout, timeout))
+
+    def observe(self, key: Hashable, rtt: float):
+        self._estimator(key).observe(rtt)
+        self.overall.observe(rtt)
+
+    def on_timeout(self, key: Hashable):
+        estimator = self._estimator(key)
+        estimator.timeouts += 1
+        estimator.backoff = min(estimator.backoff * self.backoff_factor, self.max_timeout / self.min_timeout)
+
+    def stats(self) -> Dict[Hashable, RttStats]:
+        return {key: RttStats(srtt=e.srtt, rttvar=e.rttvar, timeout=self.timeout(key), samples=e.samples, timeouts=e.timeouts)
+                for key, e in self.estimators.items()}
+
+
+__all__ = [
+    "RttStats",
+    "RttEstimator",
+    "RetryPolicy",
+]
@@ -0,0 +1,257 @@
+import time
+import logging
+from dataclasses import dataclass, fields
+from typing import List, Optional, Dict, Any, Callable
+
+from dl24 import BaseDL24, BroadcastPacket, DL24Error, DL24NoResponseError, ByteWaitTime_s
+from dl24.policy import RttEstimator
+
+logger = logging.getLogger("dl24.profile")
+
+
+class ProfileError(Exception):
+    pass
+
+
+@dataclass
+class Setpoint:
+    at: float  # s, from the start of the run
+    current: float  # A
+    step: int  # index of the top-level step
+
+
+@dataclass
+class StopConditions:
+    voltage_below: Optional[float] = None  # V
+    charge_above: Optional[float] = None  # Ah
+    energy_above: Optional[float] = None  # Wh
+    temperature_above: Optional[float] = None  # celsius
+    time_above: Optional[float] = None  # s, from the start of the run
+
+    def check(self, packet: BroadcastPacket) -> Optional[str]:
+        if self.voltage_below is not None and packet.voltage < self.voltage_below:
+            return f"voltage {packet.voltage:.2f} V below {self.voltage_below} V"
+        if self.charge_above is not None and packet.capacity > self.charge_above:
+            return f"charge {packet.capacity:.3f} Ah above {self.charge_above} Ah"
+        if self.energy_above is not None and packet.energy > self.energy_above:
+            return f"energy {packet.energy:.2f} Wh above {self.energy_above} Wh"
+        if self.temperature_above is not None and packet.temperature > self.temperature_above:
+            return f"temperature {packet.temperature} °C above {self.temperature_above} °C"
+        return None
+
+
+@dataclass
+class Profile:
+    setpoints: List[Setpoint]
+    duration: float  # s
+    stop: StopConditions
+    voltage_cutoff: Optional[float] = None  # V
+    reset_counters: bool = False
+
+
+@dataclass
+class SetpointEvent:
+    setpoint: Setpoint
+    target: float  # s, from the start of the run
+    sent: Optional[float]  # s
+    acked: Optional[float]  # s, None when skipped because the next setpoint was already due
+
+
+def _number(step: Dict[str, Any], key: str, minimum: float = 0) -> float:
+    value = step.get(key)
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or value < minimum:
+        raise ProfileError(f"'{key}' must be a number not less than {minimum} in step {step}")
+    return float(value)
+
+
+def _mapping(step: Dict[str, Any], key: str, index: int) -> Dict[str, Any]:
+    value = step[key]
+    if not isinstance(value, dict):
+        raise ProfileError(f"'{key}' must be a mapping in step {index}, got {value!r}")
+    return value
+
+
+def _expand_steps(steps: List[Dict[str, Any]], at: float, out: List[Setpoint], top_index: Optional[int]) -> float:
+    if not isinstance(steps, list):
+        raise ProfileError("'steps' must be a list")
+
+    for i, step in enumerate(steps):
+        index = top_index if top_index is not None else i
+        if not isinstance(step, dict):
+            raise ProfileError(f"invalid step {step}")
+
+        if "current" in step:
+            out.append(Setpoint(at, _number(step, "current"), index))
+            at += _number(step, "duration")
+        elif "pulse" in step:
+            pulse = _mapping(step, "pulse", index)
+            high, low = _number(pulse, "high"), _number(pulse, "low")
+            high_duration, low_duration = _number(pulse, "high_duration"), _number(pulse, "low_duration")
+            for _ in range(int(_number(pulse, "count", 1))):
+                out.append(Setpoint(at, high, index))
+                out.append(Setpoint(at + high_duration, low, index))
+                at += high_duration + low_duration
+        elif "ramp" in step:
+            ramp = _mapping(step, "ramp", index)
+            start, end, duration = _number(ramp, "from"), _number(ramp, "to"), _number(ramp, "duration")
+            step_size = _number(ramp, "step", 0.001) if "step" in ramp else 0.1
+            count = max(2, round(abs(end - start) / step_size) + 1)
+            for k in range(count):
+                out.append(Setpoint(at + duration * k / count, start + (end - start) * k / (count - 1), index))
+            at += duration
+        elif "repeat" in step:
+            repeat = _mapping(step, "repeat", index)
+            for _ in range(int(_number(repeat, "count", 1))):
+                at = _expand_steps(repeat.get("steps"), at, out, index)
+        else:
+            raise ProfileError(f"unknown step {step}")
+    return at
+
+
+def _optional_number(data: Dict[str, Any], key: str, what: str) -> Optional[float]:
+    value = data.get(key)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ProfileError(f"{what} '{key}' must be a number, got {value!r}")
+
+
+def parse_profile(data: Dict[str, Any]) -> Profile:
+    if not isinstance(data, dict):
+        raise ProfileError("profile must be a mapping")
+
+    stop = data.get("stop") or {}
+    if not isinstance(stop, dict):
+        raise ProfileError("'stop' must be a mapping")
+    names = {f.name for f in fields(StopConditions)}
+    unknown = set(stop) - names
+    if unknown:
+        raise ProfileError(f"unknown stop conditions: {', '.join(sorted(unknown))}")
+
+    setpoints: List[Setpoint] = []
+    duration = _expand_steps(data.get("steps"), 0.0, setpoints, None)
+    if len(setpoints) == 0:
+        raise ProfileError("profile has no steps")
+
+    return Profile(
+            setpoints=setpoints,
+            duration=duration,
+            stop=StopConditions(**{k: _optional_number(stop, k, "stop condition") for k in stop}),
+            voltage_cutoff=_optional_number(data, "voltage_cutoff", "setting"),
+            reset_counters=bool(data.get("reset_counters", False)),
+    )
+
+
+def load_profile(path: str) -> Profile:
+    with open(path) as f:
+        if path.endswith(".json"):
+            import json
+            try:
+                data = json.load(f)
+            except ValueError as e:
+                raise ProfileError(f"invalid JSON: {e}")
+        else:
+            import yaml
+            try:
+                data = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ProfileError(f"invalid YAML: {e}")
+    return parse_profile(data)
+
+
+class ProfileRunner:
+    # Setpoints are scheduled against a fixed monotonic start time, so a slow or retried command delays only its own
+    # setpoint. Each command is sent ahead of its target by half of the smoothed ACK latency, and a setpoint whose
+    # successor is already due is skipped instead of being sent late.
+    def __init__(self, dl24: BaseDL24, profile: Profile,
+                 on_event: Optional[Callable[[SetpointEvent], None]] = None,
+                 on_broadcast: Optional[Callable[[float, BroadcastPacket], None]] = None):
+        self.dl24 = dl24
+        self.profile = profile
+        self.on_event = on_event
+        self.on_broadcast = on_broadcast
+        self.latency = RttEstimator()
+        self.start = None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def _wait_until(self, at: float) -> Optional[str]:
+        time_above = self.profile.stop.time_above
+        if time_above is not None and at >= time_above:
+            at = time_above
+
+        while True:
+            remaining = at - self.elapsed()
+            if remaining <= 0:
+                if time_above is not None and at >= time_above:
+                    return f"time above {time_above} s"
+                return None
+            if remaining <= ByteWaitTime_s:  # reads block for up to ByteWaitTime_s, the rest is slept precisely
+                time.sleep(remaining)
+                continue
+            try:
+                packet = self.dl24.wait_for_broadcast(timeout=remaining - ByteWaitTime_s)
+            except DL24NoResponseError:
+                continue
+            if self.on_broadcast is not None:
+                self.on_broadcast(self.elapsed(), packet)
+            reason = self.profile.stop.check(packet)
+            if reason is not None:
+                return reason
+
+    def _emit(self, event: SetpointEvent):
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def run(self) -> str:
+        setpoints = self.profile.setpoints
+        if self.profile.voltage_cutoff is not None:
+            self.dl24.set_voltage_cutoff(self.profile.voltage_cutoff)
+        if self.profile.reset_counters:
+            self.dl24.reset_counters()
+
+        enabled = False
+        self.start = time.monotonic()
+        try:
+            for i, setpoint in enumerate(setpoints):
+                lead = self.latency.srtt / 2 if self.latency.srtt is not None else 0
+                reason = self._wait_until(setpoint.at - lead)
+                if reason is not None:
+                    return reason
+
+                next_at = setpoints[i + 1].at if i + 1 < len(setpoints) else self.profile.duration
+                if self.elapsed() >= next_at:
+                    self._emit(SetpointEvent(setpoint, setpoint.at, None, None))
+                    continue
+
+                sent = self.elapsed()
+                self.dl24.set_current(setpoint.current)
+                self.latency.observe(self.elapsed() - sent)
+                if not enabled:
+                    self.dl24.enable()
+                    enabled = True
+                self._emit(SetpointEvent(setpoint, setpoint.at, sent, self.elapsed()))
+
+            return self._wait_until(self.profile.duration) or "completed"
+        finally:
+            # a failure here must not hide the one that ended the run
+            if enabled:
+                try:
+                    self.dl24.disable()
+                except DL24Error as e:
+                    logger.error("could not disable the output: %s", e)
+
+
+__all__ = [
+    "ProfileError",
+    "Setpoint",
+    "StopConditions",
+    "Profile",
+    "SetpointEvent",
+    "ProfileRunner",
+    "parse_profile",
+    "load_profile",
+]
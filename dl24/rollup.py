@@ -0,0 +1,296 @@
+import os
+import re
+import glob
+import math
+import struct
+import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from dl24 import BroadcastPacket
+from dl24.binlog import datetime_to_timestamp
+from dl24.dataset import Dataset, load_log
+from dl24.segments import segment_path, first_date, list_segments, purge_segments
+
+# Rollup file layout: 16-byte header followed by one fixed-size little-endian record per bucket. Bucket start times
+# use the same local wall clock timestamps as binary logs, so hour buckets are aligned to local hours.
+# A bucket is written once a sample of a later bucket arrives, or when the writer is closed.
+MAGIC = b"DL24RUP\x00"
+VERSION = 1
+
+HeaderStruct = struct.Struct("<8sHHI")  # magic, version, record size, bucket length in seconds
+# start, sample count, min/max/mean/last of voltage, current, power and temperature, last energy, charge and on-time
+RecordStruct = struct.Struct("<dI16fffI")
+
+HEADER_SIZE = HeaderStruct.size
+RECORD_SIZE = RecordStruct.size
+
+Quantities = ("voltage", "current", "power", "temperature")
+
+RollupDtype = np.dtype(
+        [("start", "<f8"), ("count", "<u4")] +
+        [(f"{q}_{s}", "<f4") for q in Quantities for s in ("min", "max", "mean", "last")] +
+        [("energy", "<f4"), ("charge", "<f4"), ("on_time", "<u4")])
+assert RollupDtype.itemsize == RECORD_SIZE
+
+DefaultTiers = "1m,1h"  # DL24 broadcasts once per second, a 1s tier would only repeat the raw log
+
+_units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class RollupError(Exception):
+    pass
+
+
+def parse_tier(value: str) -> int:
+    m = re.fullmatch(r"(\d+)([smhd])", value.strip())
+    if m is None or int(m.group(1)) == 0:
+        raise RollupError(f"invalid tier {value}, expected e.g. 1s, 10m or 1h")
+    return int(m.group(1)) * _units[m.group(2)]
+
+
+def parse_tiers(value: str) -> List[int]:
+    return sorted(set(parse_tier(x) for x in value.split(",")))
+
+
+def format_tier(bucket_s: int) -> str:
+    for unit, size in reversed(_units.items()):
+        if bucket_s % size == 0:
+            return f"{bucket_s // size}{unit}"
+
+
+def rollup_path(log_path: str, bucket_s: int) -> str:
+    return f"{os.path.splitext(log_path)[0]}.{format_tier(bucket_s)}.rollup"
+
+
+def read_header(f) -> int:
+    data = f.read(HEADER_SIZE)
+    if len(data) != HEADER_SIZE:
+        raise RollupError("truncated header")
+    magic, version, record_size, bucket_s = HeaderStruct.unpack(data)
+    if magic != MAGIC:
+        raise RollupError("not a DL24 rollup")
+    if version != VERSION or record_size != RECORD_SIZE:
+        raise RollupError(f"unsupported rollup version {version}")
+    return bucket_s
+
+
+class RollupWriter:
+    def __init__(self, path: str, bucket_s: int, append: bool = False):
+        self.bucket_s = bucket_s
+        is_new = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+        if not is_new:
+            with open(path, "rb") as f:
+                if read_header(f) != bucket_s:
+                    raise RollupError(f"{path} holds buckets of a different length")
+            size = os.path.getsize(path)
+            valid_size = HEADER_SIZE + (size - HEADER_SIZE) // RECORD_SIZE * RECORD_SIZE
+            if valid_size != size:
+                os.truncate(path, valid_size)
+
+        self.file = open(path, "ab" if not is_new else "wb")
+        if is_new:
+            self.file.write(HeaderStruct.pack(MAGIC, VERSION, RECORD_SIZE, bucket_s))
+        self.start = None
+
+    def add(self, timestamp: float, packet: BroadcastPacket):
+        start = math.floor(timestamp / self.bucket_s) * self.bucket_s
+        if start != self.start:
+            self._write_bucket()
+            self.start = start
+            self.count = 0
+            self.stats = [[math.inf, -math.inf, 0.0] for _ in Quantities]
+
+        self.count += 1
+        self.last = packet
+        for stats, value in zip(self.stats, (packet.voltage, packet.current, packet.power, packet.temperature)):
+            if value < stats[0]:
+                stats[0] = value
+            if value > stats[1]:
+                stats[1] = value
+            stats[2] += value
+
+    def _write_bucket(self):
+        if self.start is None:
+            return
+        p = self.last
+        values = []
+        for (low, high, total), last in zip(self.stats, (p.voltage, p.current, p.power, p.temperature)):
+            values += [low, high, total / self.count, last]
+        self.file.write(RecordStruct.pack(self.start, self.count, *values, p.energy, p.capacity, int(p.time.total_seconds())))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self._write_bucket()
+        self.start = None
+        self.file.close()
+
+
+class TieredRollup:
+    # one RollupWriter per tier next to the log, e.g. test.1m.rollup and test.1h.rollup for test.csv
+    def __init__(self, log_path: str, tiers: Sequence[int], append: bool = False):
+        self.writers = [RollupWriter(rollup_path(log_path, x), x, append) for x in tiers]
+
+    def add(self, date: datetime.datetime, packet: BroadcastPacket):
+        timestamp = datetime_to_timestamp(date)
+        for writer in self.writers:
+            writer.add(timestamp, packet)
+
+    def flush(self):
+        for writer in self.writers:
+            writer.flush()
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+
+def open_rollup(path: str) -> Tuple[int, np.ndarray]:
+    with open(path, "rb") as f:
+        bucket_s = read_header(f)
+    count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_SIZE
+    if count == 0:
+        return bucket_s, np.zeros(0, dtype=RollupDtype)
+    return bucket_s, np.memmap(path, dtype=RollupDtype, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+def find_rollups(log_path: str) -> Dict[int, str]:
+    rollups = {}
+    for path in glob.glob(glob.escape(os.path.splitext(log_path)[0]) + ".*.rollup"):
+        try:
+            with open(path, "rb") as f:
+                rollups[read_header(f)] = path
+        except (OSError, RollupError):
+            pass
+    return rollups
+
+
+def rollup_to_dataset(records: np.ndarray, bucket_s: int) -> Dataset:
+    # every bucket becomes two points holding its minimum and maximum, so extremes stay visible like with min/max decimation
+    start = records["start"]
+    date = (np.stack([start, start + bucket_s / 2], axis=1).ravel() * 1000).astype(np.int64).astype("datetime64[ms]")
+
+    def envelope(quantity: str) -> np.ndarray:
+        return np.stack([records[f"{quantity}_min"], records[f"{quantity}_max"]], axis=1).ravel().astype(np.float64)
+
+    def twice(field: str) -> np.ndarray:
+        return np.repeat(records[field].astype(np.float64), 2)
+
+    return Dataset(
+            date=date,
+            voltage=envelope("voltage"),
+            current=envelope("current"),
+            power=envelope("power"),
+            energy=twice("energy"),
+            charge=twice("charge"),
+            temperature=envelope("temperature"),
+            time_seconds=twice("on_time"),
+    )
+
+
+def raw_start(path: str) -> Optional[datetime.datetime]:
+    segments = list_segments(path)
+    if len(segments) > 0:
+        return segments[0][0]
+    return first_date(path)
+
+
+def select_tier(path: str, since: Optional[datetime.datetime], until: Optional[datetime.datetime],
+                points: int) -> Optional[int]:
+    # Coarsest rollup tier that still has at least `points` values over the range and covers its start,
+    # None for the raw log. Falls back to the finest rollup covering the range when the raw data is gone.
+    rollups = {}
+    for bucket_s, rollup in find_rollups(path).items():
+        _, records = open_rollup(rollup)
+        if len(records) > 0:
+            rollups[bucket_s] = records
+    if len(rollups) == 0:
+        return None
+
+    finest = min(rollups)
+    first = float(rollups[finest]["start"][0])  # the first bucket of coarser tiers starts before the data
+    last = max(float(x["start"][-1]) + bucket_s for bucket_s, x in rollups.items())
+    start = datetime_to_timestamp(since) if since is not None else first
+    end = datetime_to_timestamp(until) if until is not None else last
+
+    covering = [bucket_s for bucket_s, records in rollups.items() if records["start"][0] <= max(start, first)]
+    for bucket_s in sorted(covering, reverse=True):
+        if (end - start) / bucket_s * 2 >= points:  # two points per bucket
+            return bucket_s
+
+    raw = raw_start(path)
+    if raw is not None and datetime_to_timestamp(raw) <= max(start, first) + finest:
+        return None
+    return min(covering) if covering else None
+
+
+def _filter(dataset: Dataset, since: Optional[datetime.datetime], until: Optional[datetime.datetime]) -> Dataset:
+    mask = np.ones(len(dataset), dtype=bool)
+    if since is not None:
+        mask &= dataset.date >= np.datetime64(since)
+    if until is not None:
+        mask &= dataset.date < np.datetime64(until)
+    return Dataset(*(getattr(dataset, f)[mask] for f in Dataset.__dataclass_fields__))
+
+
+def load_raw(path: str, since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None,
+             loader: Callable[[str], Dataset] = load_log) -> Dataset:
+    # the log and its rotated segments overlapping the range
+    segments = list_segments(path)
+    paths = []
+    for i, (start, segment) in enumerate(segments):
+        end = segments[i + 1][0] if i + 1 < len(segments) else None
+        if (until is None or start < until) and (since is None or end is None or end > since):
+            paths.append(segment)
+    if os.path.exists(path):
+        paths.append(path)
+
+    parts = [loader(x) for x in paths]
+    parts = [x for x in parts if len(x) > 0]
+    if len(parts) == 0:
+        return loader(path)
+    dataset = Dataset(*(np.concatenate([getattr(x, f) for x in parts]) for f in Dataset.__dataclass_fields__))
+    return _filter(dataset, since, until)
+
+
+def load_range(path: str, since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None,
+               points: int = 1000, tier: Optional[int] = None,
+               loader: Callable[[str], Dataset] = load_log) -> Tuple[Optional[int], Dataset]:
+    # returns the tier used, None for the raw log, and its samples in the range
+    if tier is None:
+        tier = select_tier(path, since, until, points)
+    if tier is None:
+        return None, load_raw(path, since, until, loader)
+
+    rollup = find_rollups(path).get(tier)
+    if rollup is None:
+        raise RollupError(f"no {format_tier(tier)} rollup for {path}")
+    _, records = open_rollup(rollup)
+    first, last = 0, len(records)
+    if since is not None:
+        first = np.searchsorted(records["start"], datetime_to_timestamp(since) - tier, side="right")
+    if until is not None:
+        last = np.searchsorted(records["start"], datetime_to_timestamp(until), side="left")
+    return tier, rollup_to_dataset(records[first:max(first, last)], tier)
+
+
+__all__ = [
+    "RollupError",
+    "RollupWriter",
+    "TieredRollup",
+    "parse_tiers",
+    "format_tier",
+    "rollup_path",
+    "open_rollup",
+    "find_rollups",
+    "rollup_to_dataset",
+    "segment_path",
+    "list_segments",
+    "purge_segments",
+    "select_tier",
+    "load_raw",
+    "load_range",
+]
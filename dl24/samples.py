@@ -0,0 +1,131 @@
+import datetime
+
+import numpy as np
+
+from dl24 import BroadcastPacket, BroadcastStruct, unpack_uint24
+
+SampleDtype = np.dtype([
+    ("timestamp", "<f8"),  # s, from the producer's epoch, e.g. UTC seconds
+    ("voltage", "<f8"),  # V
+    ("current", "<f8"),  # A
+    ("capacity", "<f8"),  # Ah
+    ("energy", "<f8"),  # Wh
+    ("temperature", "<i2"),  # celsius
+    ("time_seconds", "<u4"),  # on time
+])
+
+
+class Sample:
+    # view of one sample in a SampleBuffer, valid until the buffer wraps around and overwrites it
+    __slots__ = ("_record",)
+
+    def __init__(self, record: np.void):
+        self._record = record
+
+    @property
+    def timestamp(self) -> float:
+        return float(self._record["timestamp"])
+
+    @property
+    def voltage(self) -> float:
+        return float(self._record["voltage"])
+
+    @property
+    def current(self) -> float:
+        return float(self._record["current"])
+
+    @property
+    def power(self) -> float:
+        return self.voltage * self.current
+
+    @property
+    def capacity(self) -> float:
+        return float(self._record["capacity"])
+
+    @property
+    def energy(self) -> float:
+        return float(self._record["energy"])
+
+    @property
+    def temperature(self) -> int:
+        return int(self._record["temperature"])
+
+    @property
+    def time(self) -> datetime.timedelta:
+        return datetime.timedelta(seconds=int(self._record["time_seconds"]))
+
+    def __repr__(self):
+        return f"Sample(timestamp={self.timestamp}, voltage={self.voltage}, current={self.current}, " \
+               f"capacity={self.capacity}, energy={self.energy}, temperature={self.temperature}, time={self.time})"
+
+
+class SampleBuffer:
+    # Fixed-capacity ring of SampleDtype records. Every record is stored twice, at its slot and one capacity further,
+    # so the last n samples are always one contiguous slice and windows are returned as views without copying.
+    # A view shows newer samples once more than capacity - len(view) samples have been appended after taking it.
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.total = 0  # samples appended since creation, including overwritten ones
+        self.data = np.zeros(capacity * 2, dtype=SampleDtype)
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def append(self, timestamp: float, voltage: float, current: float, capacity: float, energy: float,
+               temperature: int, time_seconds: int):
+        slot = self.total % self.capacity
+        record = (timestamp, voltage, current, capacity, energy, temperature, time_seconds)
+        self.data[slot] = record
+        self.data[slot + self.capacity] = record
+        self.total += 1
+
+    def append_packet(self, timestamp: float, packet: BroadcastPacket):
+        self.append(timestamp, packet.voltage, packet.current, packet.capacity, packet.energy, packet.temperature,
+                    int(packet.time.total_seconds()))
+
+    def append_frame(self, timestamp: float, payload: bytes):
+        # payload of a broadcast frame as passed to _parse_broadcast, decoded without building a BroadcastPacket
+        voltage, current, capacity, energy, temperature, hours, minutes, seconds = BroadcastStruct.unpack(payload)
+        self.append(timestamp, unpack_uint24(voltage) / 10, current / 1000, capacity * 10 / 1000, energy * 10,
+                    temperature, hours * 3600 + minutes * 60 + seconds)
+
+    def extend(self, samples: np.ndarray):
+        samples = samples[-self.capacity:]
+        slots = (self.total + np.arange(len(samples))) % self.capacity
+        self.data[slots] = samples
+        self.data[slots + self.capacity] = samples
+        self.total += len(samples)
+
+    def last(self, count: int) -> np.ndarray:
+        count = max(0, min(count, len(self)))
+        end = self.total % self.capacity + self.capacity
+        return self.data[end - count:end]
+
+    def samples(self) -> np.ndarray:
+        return self.last(len(self))
+
+    def since(self, timestamp: float) -> np.ndarray:
+        # assumes timestamps are appended in ascending order
+        samples = self.samples()
+        return samples[np.searchsorted(samples["timestamp"], timestamp):]
+
+    def __getitem__(self, index: int) -> Sample:
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("sample index out of range")
+        return Sample(self.data[self.total % self.capacity + self.capacity - size + index])
+
+    def __iter__(self):
+        for record in self.samples():
+            yield Sample(record)
+
+
+__all__ = [
+    "SampleDtype",
+    "Sample",
+    "SampleBuffer",
+]
@@ -0,0 +1,79 @@
+import os
+import re
+import glob
+import time
+import datetime
+from typing import List, Optional, Tuple
+
+from dl24.binlog import MAGIC, HEADER_SIZE, RECORD_SIZE, RecordStruct
+
+# A rotated log is renamed after its start date, test.csv becomes test.20261017-120000.csv, and the monitor
+# continues writing to test.csv. The log and its segments form one run.
+SegmentTimeFormat = "%Y%m%d-%H%M%S"
+
+_segment_re = re.compile(r"\.(\d{8}-\d{6})$")
+
+
+def segment_path(path: str, start: datetime.datetime) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.{start.strftime(SegmentTimeFormat)}{ext}"
+
+
+def segment_parent(path: str) -> Optional[str]:
+    # the log a segment was rotated from, None when path is not named like a segment
+    root, ext = os.path.splitext(path)
+    m = _segment_re.search(root)
+    if m is None:
+        return None
+    return root[:m.start()] + ext
+
+
+def first_date(path: str) -> Optional[datetime.datetime]:
+    # date of the first sample of a CSV or binary log, None when it has none
+    try:
+        with open(path, "rb") as f:
+            data = f.read(HEADER_SIZE + RECORD_SIZE)
+        if data.startswith(MAGIC):
+            if len(data) < HEADER_SIZE + RECORD_SIZE:
+                return None
+            return datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=RecordStruct.unpack_from(data, HEADER_SIZE)[0])
+        with open(path) as f:
+            f.readline()
+            line = f.readline()
+        return datetime.datetime.strptime(line.split(",")[0], "%Y-%m-%d %H:%M:%S") if line else None
+    except (OSError, ValueError):
+        return None
+
+
+def list_segments(path: str) -> List[Tuple[datetime.datetime, str]]:
+    # rotated raw segments of a log with their start dates, oldest first
+    root, ext = os.path.splitext(path)
+    segments = []
+    for segment in glob.glob(glob.escape(root) + ".*" + glob.escape(ext)):
+        m = _segment_re.search(os.path.splitext(segment)[0])
+        if m is not None and os.path.splitext(segment)[0][:m.start()] == root:
+            segments.append((datetime.datetime.strptime(m.group(1), SegmentTimeFormat), segment))
+    return sorted(segments)
+
+
+def purge_segments(path: str, retention_s: float) -> List[str]:
+    # removes the rotated raw segments last written more than retention_s ago
+    limit = time.time() - retention_s
+    removed = []
+    for _, segment in list_segments(path):
+        try:
+            if os.path.getmtime(segment) < limit:
+                os.remove(segment)
+                removed.append(segment)
+        except OSError:
+            pass
+    return removed
+
+
+__all__ = [
+    "segment_path",
+    "segment_parent",
+    "first_date",
+    "list_segments",
+    "purge_segments",
+]
@@ -0,0 +1,165 @@
+import os
+import sys
+import time
+import ctypes
+import select
+import logging
+import datetime
+import threading
+from dataclasses import dataclass, replace
+from typing import Callable, Iterator, Optional, Tuple, Union
+
+from dl24 import BaseDL24, BroadcastPacket, DL24Error
+
+logger = logging.getLogger("dl24.session")
+
+BackoffMin_s = 0.05
+BackoffMax_s = 2.0
+WatchPollInterval_s = 0.1  # used where inotify is not available
+
+# inotify(7)
+_IN_ATTRIB = 0x00000004
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+
+
+@dataclass
+class Gap:
+    start: datetime.datetime  # last sample before the outage
+    end: datetime.datetime  # first sample after it
+    reason: str
+    charge: Optional[float]  # Ah counted by the device during the outage, None when its counters were reset
+    energy: Optional[float]  # Wh
+    counters_reset: bool
+
+    @property
+    def duration(self) -> float:  # s
+        return (self.end - self.start).total_seconds()
+
+
+SessionEvent = Union[BroadcastPacket, Gap, DL24Error]
+
+
+def _inotify_wait(path: str, timeout: float) -> Optional[bool]:
+    # None when inotify cannot be used
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+
+    try:
+        if libc.inotify_add_watch(fd, os.path.dirname(os.path.abspath(path)).encode(), _IN_CREATE | _IN_ATTRIB | _IN_MOVED_TO) < 0:
+            return None
+        deadline = time.monotonic() + timeout
+        while not os.path.exists(path):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if select.select([fd], [], [], remaining)[0]:
+                os.read(fd, 4096)
+        return True
+    finally:
+        os.close(fd)
+
+
+def wait_for_path(path: str, timeout: float) -> bool:
+    # waits until path exists, e.g. a tty node coming back after the adapter was replugged
+    if os.path.exists(path):
+        return True
+    if sys.platform.startswith("linux"):
+        found = _inotify_wait(path, timeout)
+        if found is not None:
+            return found
+
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(WatchPollInterval_s)
+    return True
+
+
+class Session:
+    # Keeps reading packets across disconnects. Reconnects with exponential backoff, or as soon as the device node
+    # reappears when it was removed, and reports each outage as a Gap before the first packet after it.
+    # Device counters (capacity, energy, on-time) are kept cumulative: when they restart from zero after an outage
+    # (the device was power cycled) the values from before it are added to every following packet.
+    def __init__(self, open_device: Callable[[], BaseDL24], read_packets: Callable[[BaseDL24], Iterator[BroadcastPacket]],
+                 stop: threading.Event, watch_path: Optional[str] = None,
+                 backoff_min: float = BackoffMin_s, backoff_max: float = BackoffMax_s):
+        self.open_device = open_device
+        self.read_packets = read_packets
+        self.stop = stop
+        self.watch_path = watch_path
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+
+        self.last: Optional[Tuple[datetime.datetime, BroadcastPacket]] = None  # as received from the device
+        self.outage: Optional[Tuple[datetime.datetime, str]] = None
+        self.capacity_offset = 0.0
+        self.energy_offset = 0.0
+        self.time_offset = datetime.timedelta()
+
+    def _end_outage(self, date: datetime.datetime, packet: BroadcastPacket) -> Gap:
+        start, reason = self.outage
+        self.outage = None
+        last = self.last[1]
+        if packet.capacity >= last.capacity and packet.energy >= last.energy and packet.time >= last.time:
+            return Gap(start, date, reason, packet.capacity - last.capacity, packet.energy - last.energy, False)
+
+        self.capacity_offset += last.capacity
+        self.energy_offset += last.energy
+        self.time_offset += last.time
+        logger.info("device counters were reset during the outage, continuing from %.3f Ah", self.capacity_offset)
+        return Gap(start, date, reason, None, None, True)
+
+    def _reconcile(self, packet: BroadcastPacket) -> BroadcastPacket:
+        if self.capacity_offset == 0 and self.energy_offset == 0 and not self.time_offset:
+            return packet
+        return replace(packet, capacity=packet.capacity + self.capacity_offset, energy=packet.energy + self.energy_offset,
+                       time=packet.time + self.time_offset)
+
+    def _wait(self, backoff: float):
+        if self.watch_path is not None and not os.path.exists(self.watch_path):
+            logger.info("waiting for %s to appear", self.watch_path)
+            while not self.stop.is_set() and not wait_for_path(self.watch_path, self.backoff_max):
+                pass
+        else:
+            self.stop.wait(backoff)
+
+    def events(self) -> Iterator[Tuple[datetime.datetime, SessionEvent]]:
+        backoff = self.backoff_min
+        while not self.stop.is_set():
+            dl24 = None
+            try:
+                dl24 = self.open_device()
+                for packet in self.read_packets(dl24):
+                    date = datetime.datetime.now()
+                    if self.outage is not None:
+                        yield date, self._end_outage(date, packet)
+                    self.last = (date, packet)
+                    backoff = self.backoff_min
+                    yield date, self._reconcile(packet)
+                    if self.stop.is_set():
+                        return
+            except DL24Error as e:
+                date = datetime.datetime.now()
+                if self.outage is None and self.last is not None:
+                    self.outage = (self.last[0], str(e))
+                yield date, e
+            finally:
+                if dl24 is not None:
+                    dl24.close()
+
+            self._wait(backoff)
+            backoff = min(backoff * 2, self.backoff_max)
+
+
+__all__ = [
+    "Gap",
+    "Session",
+    "wait_for_path",
+]
@@ -0,0 +1,151 @@
+import sys
+import json
+import dataclasses
+import time
+import logging
+import argparse
+import platform
+from typing import Callable, List, Optional, Dict, Any
+
+from dl24 import DL24, DL24Error, VOLTAGE, SETCURR, SnapshotRegisters, ByteWaitTime_s, PacketWaitTime_s, pack_decimal
+from dl24.emulator import DL24Emulator
+
+
+def percentile(values: List[float], p: float) -> float:
+    if len(values) == 0:
+        return float("nan")
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def measure(name: str, iterations: int, fn: Callable[[], None], before: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    latencies = []
+    errors = 0
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if before is not None:
+            before()
+        s = time.perf_counter()
+        try:
+            fn()
+        except DL24Error:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - s)
+    duration = time.perf_counter() - start
+
+    return {
+        "name": name,
+        "iterations": iterations,
+        "errors": errors,
+        "ops_per_s": len(latencies) / duration if duration > 0 else 0,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if len(latencies) > 0 else float("nan"),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000 if len(latencies) > 0 else float("nan"),
+    }
+
+
+def run_benchmarks(dl24: DL24, emulator: Optional[DL24Emulator], iterations: int) -> List[Dict[str, Any]]:
+    # commands re-send the current setpoint, so a connected load is left as it was
+    setpoint = pack_decimal(dl24.get_current_limit())
+
+    results = [
+        measure("read_value", iterations, lambda: dl24.read_value([VOLTAGE, 0, 0])),
+        measure("read_values", max(1, iterations // 10), lambda: dl24.read_values(SnapshotRegisters)),
+        measure("execute_command", iterations, lambda: dl24.execute_command(SETCURR, setpoint)),
+        measure("wait_for_broadcast", max(1, iterations // 10), dl24.wait_for_broadcast),
+    ]
+
+    if emulator is not None:
+        for kind in ("drop", "corrupt"):
+            # a clean request before every fault lets the retry policy settle back to the measured round-trip time
+            def inject():
+                dl24.read_value([VOLTAGE, 0, 0])
+                dl24.execute_command(SETCURR, setpoint)
+                emulator.inject_reply_fault(kind)
+
+            trials = max(1, iterations // 20)
+            results.append(measure(f"recover_read_value_{kind}", trials,
+                                   lambda: dl24.read_value([VOLTAGE, 0, 0]), before=inject))
+            results.append(measure(f"recover_execute_command_{kind}", trials,
+                                   lambda: dl24.execute_command(SETCURR, setpoint), before=inject))
+
+    return results
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('-p', '--path', type=str, metavar="PATH", help="benchmark a real device instead of the emulator")
+    argparser.add_argument('-n', '--iterations', type=int, default=200)
+    argparser.add_argument('-f', '--format', choices=["text", "json"], default="text")
+    argparser.add_argument('-o', '--output', type=str, metavar="PATH", help="write JSON results to a file")
+    argparser.add_argument('--broadcast-interval', type=float, default=0.1, metavar="SECONDS")
+    argparser.add_argument('--latency', type=float, default=0.0, metavar="SECONDS")
+    argparser.add_argument('--noise', type=float, default=0.0, metavar="PROBABILITY")
+    argparser.add_argument('--drop', type=float, default=0.0, metavar="PROBABILITY")
+    argparser.add_argument('--seed', type=int, default=0)
+    argparser.add_argument('-d', '--debug', action='store_true')
+
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="[%(asctime)s] [%(name)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    emulator = None
+    if args.path is None:
+        emulator = DL24Emulator(broadcast_interval=args.broadcast_interval, latency=args.latency,
+                                noise=args.noise, drop=args.drop, seed=args.seed)
+        emulator.start()
+        path = emulator.port
+    else:
+        path = args.path
+
+    dl24 = DL24(path)
+    try:
+        results = run_benchmarks(dl24, emulator, args.iterations)
+        rtt = {hex(key): dataclasses.asdict(stats) for key, stats in dl24.rtt_stats().items()}
+    finally:
+        dl24.close()
+        if emulator is not None:
+            emulator.close()
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "target": "device" if emulator is None else "emulator",
+        "parameters": {
+            "iterations": args.iterations,
+            "broadcast_interval": args.broadcast_interval,
+            "latency": args.latency,
+            "noise": args.noise,
+            "drop": args.drop,
+            "byte_wait_time_s": ByteWaitTime_s,
+            "packet_wait_time_s": PacketWaitTime_s,
+            "retries_count": dl24.policy.retries,
+        },
+        "results": results,
+        "rtt": rtt,
+    }
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.format == "json":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print(f"{'benchmark':>32s} {'errors':>6s} {'ops/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'max ms':>8s}")
+        for r in results:
+            print(f"{r['name']:>32s} {r['errors']:>6d} {r['ops_per_s']:>8.1f} "
+                  f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['max_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
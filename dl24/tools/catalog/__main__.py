@@ -0,0 +1,105 @@
+import os
+import sys
+import csv
+import json
+import time
+import datetime
+import argparse
+import dataclasses
+
+from dl24.dataset import LogPatterns
+from dl24.catalog import CatalogError, SummaryFields, DefaultIndexPath, open_catalog, scan, query, failed_logs
+
+
+def parse_date(value: str) -> datetime.datetime:
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%Y-%m"):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"invalid date: {value}")
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def cmd_scan(conn, args):
+    start = time.perf_counter()
+    result = scan(conn, args.directories, args.pattern or LogPatterns, jobs=args.jobs, prune=not args.no_prune)
+    print(f"{result.added} added, {result.updated} updated, {result.unchanged} unchanged, {result.removed} removed, "
+          f"{result.failed} failed in {time.perf_counter() - start:.2f} s")
+    if args.verbose:
+        for path, error in failed_logs(conn):
+            print(f"{path}: {error}")
+
+
+def cmd_query(conn, args):
+    start = time.perf_counter()
+    runs = query(conn, since=args.since, until=args.until, min_charge=args.min_charge, max_charge=args.max_charge,
+                 min_energy=args.min_energy, max_energy=args.max_energy, voltage_below=args.voltage_below,
+                 path_glob=args.path, sort=args.sort, descending=args.desc, limit=args.limit)
+    elapsed = time.perf_counter() - start
+
+    if args.format == "json":
+        print(json.dumps([dataclasses.asdict(x) for x in runs], indent=2))
+    elif args.format == "csv":
+        wr = csv.writer(sys.stdout)
+        wr.writerow(SummaryFields)
+        wr.writerows([getattr(x, f) for f in SummaryFields] for x in runs)
+    else:
+        for run in runs:
+            print(f"{run.start_time} | {format_duration(run.duration):>9s} | {run.charge:8.2f} Ah | {run.energy:9.2f} Wh | "
+                  f"{run.min_voltage:6.2f} V | {run.peak_temperature:3.0f} °C | {run.path}")
+        print(f"{len(runs)} runs in {elapsed * 1000:.1f} ms")
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('-i', '--index', type=str, metavar="PATH", default=DefaultIndexPath)
+
+    subparsers = argparser.add_subparsers(title='subcommands', required=True)
+
+    sparser = subparsers.add_parser('scan', help="add new and changed logs to the index")
+    sparser.set_defaults(cmd=cmd_scan)
+    sparser.add_argument('directories', nargs="+", metavar="DIR")
+    sparser.add_argument('--pattern', action="append", metavar="GLOB", help=f"file name pattern, defaults to {' '.join(LogPatterns)}")
+    sparser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1)
+    sparser.add_argument('--no-prune', action='store_true', help="keep entries of deleted files")
+    sparser.add_argument('-v', '--verbose', action='store_true', help="list logs that could not be read")
+
+    sparser = subparsers.add_parser('query', help="list indexed runs")
+    sparser.set_defaults(cmd=cmd_query)
+    sparser.add_argument('--since', type=parse_date, metavar="DATE", help="runs started at or after DATE")
+    sparser.add_argument('--until', type=parse_date, metavar="DATE", help="runs started before DATE")
+    sparser.add_argument('--min-charge', type=float, metavar="AH")
+    sparser.add_argument('--max-charge', type=float, metavar="AH")
+    sparser.add_argument('--min-energy', type=float, metavar="WH")
+    sparser.add_argument('--max-energy', type=float, metavar="WH")
+    sparser.add_argument('--voltage-below', type=float, metavar="V", help="runs whose minimum voltage was below V")
+    sparser.add_argument('--path', type=str, metavar="GLOB", help="runs whose path matches GLOB")
+    sparser.add_argument('-s', '--sort', choices=SummaryFields, default="start_time")
+    sparser.add_argument('--desc', action='store_true')
+    sparser.add_argument('-n', '--limit', type=int)
+    sparser.add_argument('-f', '--format', choices=["text", "json", "csv"], default="text")
+
+    args = argparser.parse_args()
+
+    try:
+        conn = open_catalog(args.index)
+    except (CatalogError, OSError) as e:
+        print(f"Cannot open index: {e}")
+        sys.exit(1)
+
+    try:
+        args.cmd(conn, args)
+    except CatalogError as e:
+        print(e)
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import sys
+import logging
+import argparse
+
+from dl24 import DL24Error
+from dl24.client import connect
+from dl24.control import ControlLoop, ControlSample, DefaultBudget_s
+
+StatusInterval_s = 1
+
+
+def print_line(txt: str):
+    print(f"\r\u001b[2K{txt}", end='')
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('-p', '--path', type=str, metavar="PATH", required=True)
+    argparser.add_argument('mode', choices=["cp", "cr"], help="constant power or constant resistance")
+    argparser.add_argument('value', type=float, help="power in W or resistance in ohms")
+    argparser.add_argument('--max-current', type=float, required=True, metavar="A")
+    argparser.add_argument('-s', '--source', choices=["poll", "broadcast"], default="poll",
+                           help="read voltage with requests or from broadcast frames")
+    argparser.add_argument('-t', '--duration', type=float, metavar="SECONDS")
+    argparser.add_argument('--rate', type=float, metavar="HZ", help="limit the loop rate")
+    argparser.add_argument('--gain', type=float, default=1.0, help="fraction of the setpoint correction applied each iteration")
+    argparser.add_argument('--budget', type=float, default=DefaultBudget_s, metavar="SECONDS",
+                           help=f"time limit for the requests of one iteration, defaults to {DefaultBudget_s}")
+    argparser.add_argument('-d', '--debug', action='store_true')
+
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="[%(asctime)s] [%(name)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    unit = "W" if args.mode == "cp" else "Ω"
+    last_status = 0.0
+
+    def on_sample(sample: ControlSample):
+        nonlocal last_status
+        if sample.time - last_status < StatusInterval_s:
+            return
+        last_status = sample.time
+        stats = loop.stats
+        achieved = f"{sample.achieved:7.2f} {unit}" if sample.achieved is not None else "      - " + unit
+        print_line(f"{sample.voltage:5.02f} V | {sample.current:5.2f} A | set {sample.setpoint:5.2f} A | {achieved} | "
+                   f"{stats.rate:5.1f} Hz | {stats.writes} writes, {stats.skipped_writes} skipped, {stats.timeouts} timeouts")
+
+    dl24 = None
+    loop = None
+    try:
+        dl24 = connect(args.path)
+        loop = ControlLoop(dl24, "power" if args.mode == "cp" else "resistance", args.value, args.max_current,
+                           source=args.source, gain=args.gain, budget=args.budget,
+                           period=1 / args.rate if args.rate else 0.0)
+        loop.run(args.duration, on_sample)
+    except DL24Error as e:
+        print(f"\nSerial error: {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if dl24 is not None:
+            dl24.close()
+        if loop is not None:
+            stats = loop.stats
+            print()
+            print(f"iterations: {stats.iterations} in {stats.elapsed:.1f} s ({stats.rate:.1f} Hz)")
+            print(f"writes: {stats.writes}, skipped: {stats.skipped_writes}, timeouts: {stats.timeouts}")
+            print(f"tracking error: mean {stats.mean_abs_error:.3f} {unit}, rms {stats.rms_error:.3f} {unit}, "
+                  f"max {stats.error_abs_max:.3f} {unit}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import argparse
+
+from dl24.dataset import load_log, save_csv, save_binary_log
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('input', type=str, metavar="INPUT", help="CSV or binary log or raw capture saved with dl24-monitor")
+    argparser.add_argument('output', type=str, metavar="OUTPUT")
+    argparser.add_argument('-f', '--format', choices=["csv", "binary"],
+                           help="output format, defaults to csv for *.csv files and binary otherwise")
+
+    args = argparser.parse_args()
+
+    out_format = args.format or ("csv" if args.output.lower().endswith(".csv") else "binary")
+
+    dataset = load_log(args.input)
+    if out_format == "csv":
+        save_csv(dataset, args.output)
+    else:
+        save_binary_log(dataset, args.output)
+
+    print(f"Converted {len(dataset)} samples")
+
+
+if __name__ == "__main__":
+    main()
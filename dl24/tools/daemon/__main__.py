@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import errno
+import socket
+import time
+import queue
+import logging
+import argparse
+import threading
+import socketserver
+from typing import Set, Dict, Any, Optional
+
+from dl24 import DL24, DL24Error, DL24NoResponseError, DL24SerialError, BroadcastPacket, SettingsCache, Metrics
+from dl24.client import BroadcastQueueSize, encode_value, encode_broadcast, encode_error
+
+logger = logging.getLogger("dl24.daemon")
+
+ReconnectInterval_s = 1
+
+
+class DeviceOwner:
+    def __init__(self, path: str, metrics: Metrics, cache_ttl: Optional[float] = None):
+        self.path = path
+        self.metrics = metrics
+        self.cache_ttl = cache_ttl
+        self.requests = queue.Queue()
+        self.subscribers: Set[queue.Queue] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, outgoing: queue.Queue):
+        with self._lock:
+            self.subscribers.add(outgoing)
+
+    def unsubscribe(self, outgoing: queue.Queue):
+        with self._lock:
+            self.subscribers.discard(outgoing)
+
+    def _publish(self, packet: BroadcastPacket):
+        message = {"b": encode_broadcast(packet)}
+        with self._lock:
+            subscribers = list(self.subscribers)
+        for outgoing in subscribers:
+            if outgoing.qsize() < BroadcastQueueSize:  # a slow client loses broadcasts, not replies
+                outgoing.put(message)
+
+    def _execute(self, dl24: DL24, request: Dict[str, Any], deadline):
+        op = request.get("op")
+        if op == "read_value":
+            return dl24.read_value(request["payload"], deadline).hex()
+        elif op == "read_values":
+            return [encode_value(x) for x in dl24.read_values(request["registers"], deadline)]
+        elif op == "execute_command":
+            dl24.execute_command(request["command"], request["payload"], deadline)
+            return None
+        raise DL24Error(f"unknown operation {op}")
+
+    def _handle(self, dl24: DL24, request: Dict[str, Any], deadline, outgoing: queue.Queue):
+        try:
+            outgoing.put({"id": request.get("id"), "result": self._execute(dl24, request, deadline)})
+        except DL24SerialError as e:
+            outgoing.put({"id": request.get("id"), **encode_error(e)})
+            raise
+        except (DL24Error, KeyError, TypeError, ValueError) as e:
+            outgoing.put({"id": request.get("id"), **encode_error(e)})
+
+    def _fail_pending(self, e: DL24Error, timeout: float):
+        end = time.monotonic() + timeout
+        while True:
+            try:
+                request, deadline, outgoing = self.requests.get(timeout=max(0.0, end - time.monotonic()))
+            except queue.Empty:
+                return
+            outgoing.put({"id": request.get("id"), **encode_error(e)})
+
+    def run(self, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                cache = SettingsCache(self.cache_ttl) if self.cache_ttl is not None else None
+                dl24 = DL24(self.path, cache=cache, metrics=self.metrics)
+            except DL24Error as e:
+                logger.warning("%s: %s", self.path, e)
+                self._fail_pending(e, ReconnectInterval_s)
+                continue
+
+            logger.info("%s: connected", self.path)
+            dl24.broadcast_listeners.append(self._publish)
+            try:
+                while not stop.is_set():
+                    try:
+                        request, deadline, outgoing = self.requests.get_nowait()
+                    except queue.Empty:
+                        # reads whatever arrived within one byte wait time, broadcasts go to _publish
+                        try:
+                            dl24.wait_for_broadcast(timeout=0)
+                        except DL24NoResponseError:
+                            pass
+                        continue
+                    self._handle(dl24, request, deadline, outgoing)
+            except DL24SerialError as e:
+                logger.warning("%s: %s", self.path, e)
+                self._fail_pending(e, ReconnectInterval_s)
+            finally:
+                dl24.close()
+
+
+class ClientHandler(socketserver.StreamRequestHandler):
+    server: "DeviceServer"
+
+    def _write_loop(self, outgoing: queue.Queue):
+        while True:
+            message = outgoing.get()
+            if message is None:
+                return
+            try:
+                self.wfile.write(json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n")
+            except OSError:
+                return
+
+    def handle(self):
+        owner = self.server.owner
+        outgoing = queue.Queue()
+        writer = threading.Thread(target=self._write_loop, args=(outgoing,), daemon=True)
+        writer.start()
+        try:
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict):
+                    outgoing.put({"error": "error", "message": "invalid request"})
+                    continue
+
+                if request.get("op") == "subscribe":
+                    owner.subscribe(outgoing)
+                    outgoing.put({"id": request.get("id"), "result": None})
+                    continue
+
+                timeout = request.get("timeout")
+                if timeout is not None and (not isinstance(timeout, (int, float)) or isinstance(timeout, bool)):
+                    outgoing.put({"id": request.get("id"), "error": "error", "message": "invalid timeout"})
+                    continue
+                deadline = time.monotonic() + timeout if timeout is not None else None
+                owner.requests.put((request, deadline, outgoing))
+        except OSError:
+            pass
+        finally:
+            owner.unsubscribe(outgoing)
+            outgoing.put(None)
+            writer.join()
+
+
+def is_socket_in_use(socket_path: str) -> bool:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+class DeviceServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, owner: DeviceOwner):
+        # a socket left behind by a daemon that did not exit cleanly is replaced, a running daemon's is not
+        if os.path.exists(socket_path):
+            if is_socket_in_use(socket_path):
+                raise OSError(errno.EADDRINUSE, "socket is in use by a running daemon", socket_path)
+            os.unlink(socket_path)
+        super().__init__(socket_path, ClientHandler)
+        self.owner = owner
+
+
+def socket_path_for(socket_dir: str, path: str) -> str:
+    return os.path.join(socket_dir, os.path.basename(path) + ".sock")
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('-p', '--path', type=str, metavar="PATH", required=True, action="extend", nargs="+")
+    argparser.add_argument('-s', '--socket-dir', type=str, metavar="DIR", default="/tmp/dl24")
+    argparser.add_argument('-d', '--debug', action='store_true')
+    argparser.add_argument('--cache-ttl', type=float, metavar="SECONDS",
+                           help="serve settings from a cache for up to SECONDS, they are read from the device by default")
+    argparser.add_argument('--metrics-port', type=int, metavar="PORT", help="serve Prometheus metrics on http://ADDRESS:PORT/metrics")
+    argparser.add_argument('--metrics-address', type=str, metavar="ADDRESS", default="127.0.0.1")
+
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="[%(asctime)s] [%(name)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    paths = list(dict.fromkeys(args.path))
+    os.makedirs(args.socket_dir, exist_ok=True)
+
+    metrics = {path: Metrics() for path in paths}
+    if args.metrics_port is not None:
+        from dl24.metrics import serve_metrics
+        serve_metrics(args.metrics_address, args.metrics_port, lambda: metrics)
+
+    stop = threading.Event()
+    servers = []
+    try:
+        for path in paths:
+            owner = DeviceOwner(path, metrics[path], args.cache_ttl)
+            socket_path = socket_path_for(args.socket_dir, path)
+            try:
+                server = DeviceServer(socket_path, owner)
+            except OSError as e:
+                print(f"{path}: {e}")
+                sys.exit(1)
+            threading.Thread(target=owner.run, args=(stop,), daemon=True).start()
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append((socket_path, server))
+            print(f"{path} is available at {socket_path}")
+
+        stop.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        for socket_path, server in servers:
+            server.shutdown()
+            server.server_close()
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import os
+import time
+import logging
+import argparse
+
+from dl24.emulator import BatteryModel, DeviceModel, DL24Emulator
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('-l', '--link', type=str, metavar="PATH", help="create a symlink to the emulated port")
+    argparser.add_argument('-s', '--speed', type=float, default=1.0, help="simulation speed multiplier")
+    argparser.add_argument('-b', '--broadcast-interval', type=float, default=1.0, metavar="SECONDS")
+    argparser.add_argument('--capacity', type=float, default=100, metavar="AH")
+    argparser.add_argument('--internal-resistance', type=float, default=0.02, metavar="OHM")
+    argparser.add_argument('--noise', type=float, default=0.0, metavar="PROBABILITY", help="probability of corrupting a sent byte")
+    argparser.add_argument('--drop', type=float, default=0.0, metavar="PROBABILITY", help="probability of dropping a sent byte")
+    argparser.add_argument('--latency', type=float, default=0.0, metavar="SECONDS", help="reply latency")
+    argparser.add_argument('--seed', type=int)
+    argparser.add_argument('-d', '--debug', action='store_true')
+
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="[%(asctime)s] [%(name)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    battery = BatteryModel(capacity=args.capacity, internal_resistance=args.internal_resistance)
+    emulator = DL24Emulator(DeviceModel(battery), speed=args.speed, broadcast_interval=args.broadcast_interval,
+                            noise=args.noise, drop=args.drop, latency=args.latency, seed=args.seed)
+
+    if args.link is not None:
+        if os.path.islink(args.link):
+            os.unlink(args.link)
+        os.symlink(emulator.port, args.link)
+
+    print(f"Emulated DL24 is available at {args.link or emulator.port}")
+
+    emulator.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.close()
+        if args.link is not None and os.path.islink(args.link):
+            os.unlink(args.link)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,42 @@
+import sys
 import json
+import shlex
 import logging
 import datetime
 import argparse
+from typing import List, Tuple, Callable, Any, Dict
 
-from dl24 import DL24
+from dl24 import BaseDL24, DL24Error, Snapshot
+from dl24.client import connect
 
 
-def set_current(dl24: DL24, value: float):
+def set_current(dl24: BaseDL24, value: float):
     print("set_current", value)
     dl24.set_current(value)
 
 
-def set_voltage_cutoff(dl24: DL24, value: float):
+def set_voltage_cutoff(dl24: BaseDL24, value: float):
     print("set_voltage_cutoff", value)
     dl24.set_voltage_cutoff(value)
 
 
-def set_timer(dl24: DL24, value: float):
+def set_timer(dl24: BaseDL24, value: float):
     td = datetime.timedelta(seconds=value)
     print("set_timer", td)
     dl24.set_timer(td)
 
 
-def enable(dl24: DL24):
+def enable(dl24: BaseDL24):
     print("enable")
     dl24.enable()
 
 
-def disable(dl24: DL24):
+def disable(dl24: BaseDL24):
     print("disable")
     dl24.disable()
 
 
-def reset_counters(dl24: DL24):
+def reset_counters(dl24: BaseDL24):
     print("reset_counters")
     dl24.reset_counters()
 
@@ -45,17 +49,33 @@ def timedelta_to_str(x: datetime.timedelta):
     return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
 
 
-def read(dl24: DL24, out_format: str):
-    is_on = dl24.get_is_on()
-    voltage = dl24.get_voltage()
-    current = dl24.get_current()
-    energy = dl24.get_energy()
-    charge = dl24.get_charge()
-    time = dl24.get_time()
-    temp = dl24.get_temp()
-    current_limit = dl24.get_current_limit()
-    voltage_cutoff = dl24.get_voltage_cutoff()
-    timer = dl24.get_timer()
+def snapshot_to_json(snapshot: Snapshot) -> Dict[str, Any]:
+    return {
+        "enabled": snapshot.is_on,
+        "voltage": snapshot.voltage,
+        "current": snapshot.current,
+        "energy": snapshot.energy,
+        "charge": snapshot.charge,
+        "time": timedelta_to_str(snapshot.time),
+        "temperature": snapshot.temperature,
+        "current_limit": snapshot.current_limit,
+        "voltage_cutoff": snapshot.voltage_cutoff,
+        "timer": timedelta_to_str(snapshot.timer),
+    }
+
+
+def read(dl24: BaseDL24, out_format: str):
+    snapshot = dl24.snapshot()
+    is_on = snapshot.is_on
+    voltage = snapshot.voltage
+    current = snapshot.current
+    energy = snapshot.energy
+    charge = snapshot.charge
+    time = snapshot.time
+    temp = snapshot.temperature
+    current_limit = snapshot.current_limit
+    voltage_cutoff = snapshot.voltage_cutoff
+    timer = snapshot.timer
 
     if out_format == "text":
         def format_value(name, value, unit):
@@ -74,28 +94,68 @@ def read(dl24: DL24, out_format: str):
         print(format_value("voltage_cutoff", voltage_cutoff, "V"))
         print(format_value("timer", timer, None))
     elif out_format == "json":
-        print(json.dumps({
-            "enabled": is_on,
-            "voltage": voltage,
-            "current": current,
-            "energy": energy,
-            "charge": charge,
-            "time": timedelta_to_str(time),
-            "temperature": temp,
-            "current_limit": current_limit,
-            "voltage_cutoff": voltage_cutoff,
-            "timer": timedelta_to_str(timer),
-        }, indent=2))
-
-
-def main():
-    argparser = argparse.ArgumentParser()
-    argparser.set_defaults(cmd=lambda: None, cmd_args=lambda x: [])
-    argparser.add_argument('-p', '--path', type=str, metavar="PATH", required=True)
-    argparser.add_argument('-d', '--debug', action='store_true')
-
-    subparsers = argparser.add_subparsers(title='subcommands', description='valid subcommands', help='additional help')
-
+        print(json.dumps(snapshot_to_json(snapshot), indent=2))
+
+
+def run_batch(dl24: BaseDL24, commands: List[Tuple[Callable, tuple]]):
+    for cmd, cmd_args in commands:
+        cmd(dl24, *cmd_args)
+
+
+def parse_batch(lines: List[str]) -> List[Tuple[Callable, tuple]]:
+    # all commands are parsed before the port is opened, so a typo does not leave the test half set up
+    if len(lines) == 0 or lines == ["-"]:
+        lines = sys.stdin.read().splitlines()
+
+    argparser = argparse.ArgumentParser(prog="batch command")
+    argparser.set_defaults(cmd_args=lambda x: [])
+    add_commands(argparser.add_subparsers(title='commands', required=True))
+
+    commands = []
+    for line in lines:
+        line = line.strip()
+        if len(line) == 0 or line.startswith("#"):
+            continue
+        args = argparser.parse_args(shlex.split(line))
+        commands.append((args.cmd, tuple(args.cmd_args(args))))
+    return commands
+
+
+# command name -> (takes a value, handler)
+ReplCommands: Dict[str, Tuple[bool, Callable[..., Any]]] = {
+    "set-current": (True, lambda dl24, value: dl24.set_current(float(value))),
+    "set-voltage-cutoff": (True, lambda dl24, value: dl24.set_voltage_cutoff(float(value))),
+    "set-timer": (True, lambda dl24, value: dl24.set_timer(datetime.timedelta(seconds=float(value)))),
+    "enable": (False, lambda dl24: dl24.enable()),
+    "disable": (False, lambda dl24: dl24.disable()),
+    "reset": (False, lambda dl24: dl24.reset_counters()),
+    "read": (False, lambda dl24: snapshot_to_json(dl24.snapshot())),
+}
+
+
+def repl(dl24: BaseDL24):
+    # one JSON request per line on stdin, e.g. {"id": 1, "cmd": "set-current", "value": 2.5}, one JSON response per line on stdout
+    for line in sys.stdin:
+        if len(line.strip()) == 0:
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            name = request.get("cmd")
+            if name not in ReplCommands:
+                raise ValueError(f"unknown command {name}")
+            takes_value, cmd = ReplCommands[name]
+            if takes_value and "value" not in request:
+                raise ValueError(f"{name} needs a value")
+            cmd_args = (request["value"],) if takes_value else ()
+            response = {"id": request_id, "ok": True, "result": cmd(dl24, *cmd_args)}
+        except (ValueError, TypeError, AttributeError, OverflowError, DL24Error) as e:
+            response = {"id": request_id, "ok": False, "error": str(e) or type(e).__name__}
+        print(json.dumps(response), flush=True)
+
+
+def add_commands(subparsers):
     sparser = subparsers.add_parser('set-current')
     sparser.set_defaults(cmd=set_current, cmd_args=lambda x: (x.value,))
     sparser.add_argument("value", type=float)
@@ -121,14 +181,41 @@ def main():
     sparser.set_defaults(cmd=read, cmd_args=lambda x: (x.format,))
     sparser.add_argument("-f", "--format", choices=["text", "json"], default="text")
 
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.set_defaults(cmd=lambda: None, cmd_args=lambda x: [])
+    argparser.add_argument('-p', '--path', type=str, metavar="PATH", required=True)
+    argparser.add_argument('-d', '--debug', action='store_true')
+
+    subparsers = argparser.add_subparsers(title='subcommands', description='valid subcommands', help='additional help')
+    add_commands(subparsers)
+
+    sparser = subparsers.add_parser('batch', help="run several commands with one connection")
+    sparser.set_defaults(cmd=run_batch, cmd_args=lambda x: (parse_batch(x.commands),))
+    sparser.add_argument("commands", nargs="*", metavar="COMMAND",
+                         help="a quoted command with its arguments, e.g. \"set-current 2.5\"; read from stdin when omitted")
+
+    sparser = subparsers.add_parser('repl', help="run JSON-lines requests from stdin")
+    sparser.set_defaults(cmd=repl)
+
     args = argparser.parse_args()
 
     logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
                         format="[%(asctime)s] [%(name)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
 
-    dl24 = DL24(args.path)
-
-    args.cmd(dl24, *args.cmd_args(args))
+    cmd_args = args.cmd_args(args)
+    dl24 = connect(args.path)
+    try:
+        args.cmd(dl24, *cmd_args)
+    except DL24Error as e:
+        print(f"Serial error: {e}")
+        sys.exit(1)
+    except (ValueError, OverflowError) as e:
+        print(f"Invalid value: {e}")
+        sys.exit(1)
+    finally:
+        dl24.close()
 
 
 if __name__ == "__main__":
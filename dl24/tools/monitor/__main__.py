@@ -1,25 +1,220 @@
 import os
 import csv
 import sys
+import queue
 import logging
 import datetime
 import argparse
+import threading
 import time
+from typing import Iterator, Optional, Callable
 
-from dl24 import DL24, DL24Error
+from dl24 import BaseDL24, DL24Error, BroadcastPacket, Metrics
+from dl24.client import connect, is_daemon_socket
+from dl24.binlog import BinaryLogWriter, FLAG_AFTER_GAP
+from dl24.analytics import AnalyticsResult, StreamingAnalytics
+from dl24.session import Gap, Session
+from dl24.segments import segment_path, first_date, purge_segments
+
+FlushInterval_s = 1
 
 
 def print_line(txt: str):
     print(f"\r\u001b[2K{txt}", end='')
 
 
+def poll_packet(dl24: BaseDL24) -> BroadcastPacket:
+    dl24.wait_for_broadcast()
+    return BroadcastPacket(
+            voltage=dl24.get_voltage(),
+            current=dl24.get_current(),
+            capacity=dl24.get_charge(),
+            energy=dl24.get_energy(),
+            temperature=dl24.get_temp(),
+            time=dl24.get_time(),
+    )
+
+
+def iter_packets(dl24: BaseDL24, mode: str) -> Iterator[BroadcastPacket]:
+    if mode == "broadcast":
+        yield from dl24.stream_broadcasts()
+    else:
+        while True:
+            yield poll_packet(dl24)
+
+
+def format_on_time(on_time: datetime.timedelta) -> str:
+    days = on_time.days
+    seconds = on_time.seconds
+    hours = seconds // 3600
+    minutes = (seconds // 60) % 60
+    seconds = seconds % 60
+    return f"{days:01d}d {hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def format_optional(value: Optional[float], fmt: str, scale: float = 1) -> str:
+    return "" if value is None else f"{value * scale:{fmt}}"
+
+
+def format_analytics(result: AnalyticsResult) -> str:
+    resistance = format_optional(result.internal_resistance, "5.1f", 1000) or "    -"
+    time_to_cutoff = "-" if result.time_to_cutoff is None else format_on_time(datetime.timedelta(seconds=int(result.time_to_cutoff)))
+    return f"{result.charge:6.3f} Ah* | {result.energy:7.2f} Wh* | {resistance} mΩ | cutoff in {time_to_cutoff}"
+
+
+def format_gap(gap: Gap) -> str:
+    if gap.counters_reset:
+        counted = "device counters were reset"
+    else:
+        counted = f"{gap.charge:.3f} Ah, {gap.energy:.2f} Wh counted by the device meanwhile"
+    return f"Gap of {gap.duration:.1f} s ({gap.reason}), {counted}"
+
+
+class CsvLogWriter:
+    def __init__(self, path: str, append: bool, with_device: bool, with_analytics: bool = False):
+        self.with_device = with_device
+        self.with_analytics = with_analytics
+
+        if append:
+            is_new = not os.path.exists(path)
+            self.file = open(path, 'a', newline='')
+        else:
+            is_new = True
+            self.file = open(path, 'w', newline='')
+
+        self.wr = csv.writer(self.file)
+        if is_new:
+            header = ['date', 'voltage', 'current', 'power', 'energy', 'charge', 'temp', 'time_seconds', 'time_str']
+            if with_device:
+                header.append('device')
+            if with_analytics:
+                header += ['host_charge', 'host_energy', 'internal_resistance', 'voltage_min', 'voltage_max', 'time_to_cutoff']
+            self.wr.writerow(header)
+
+    def write(self, date: datetime.datetime, device: str, packet: BroadcastPacket, analytics: Optional[AnalyticsResult] = None):
+        data = [
+            date.strftime("%Y-%m-%d %H:%M:%S"),
+            f"{packet.voltage:.2f}",
+            f"{packet.current:.2f}",
+            f"{packet.power:.2f}",
+            f"{packet.energy:.2f}",
+            f"{packet.capacity:.2f}",
+            f"{packet.temperature:.0f}",
+            f"{int(packet.time.total_seconds())}",
+            format_on_time(packet.time),
+        ]
+        if self.with_device:
+            data.append(device)
+        if self.with_analytics:
+            data += [
+                f"{analytics.charge:.4f}",
+                f"{analytics.energy:.3f}",
+                format_optional(analytics.internal_resistance, ".4f"),
+                format_optional(analytics.voltage_min, ".2f"),
+                format_optional(analytics.voltage_max, ".2f"),
+                format_optional(analytics.time_to_cutoff, ".0f"),
+            ]
+        self.wr.writerow(data)
+
+    def write_gap(self, device: str, gap: Gap):
+        # a comment line, skipped by CSV loaders
+        data = [
+            "# gap",
+            gap.start.strftime("%Y-%m-%d %H:%M:%S"),
+            gap.end.strftime("%Y-%m-%d %H:%M:%S"),
+            f"{gap.duration:.1f}",
+            format_optional(gap.charge, ".3f"),
+            format_optional(gap.energy, ".3f"),
+            "counters reset" if gap.counters_reset else "",
+            gap.reason,
+        ]
+        if self.with_device:
+            data.append(device)
+        self.wr.writerow(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class BinaryWriter(BinaryLogWriter):
+    flags = 0
+
+    def write(self, date: datetime.datetime, device: str, packet: BroadcastPacket, analytics: Optional[AnalyticsResult] = None):
+        super().write(date, packet, self.flags)
+        self.flags = 0
+
+    def write_gap(self, device: str, gap: Gap):
+        self.flags |= FLAG_AFTER_GAP
+
+
+class RotatingWriter:
+    # starts a new file every rotate_s seconds, the finished one is renamed after its start date, e.g.
+    # test.20261017-120000.csv, and rotated files older than retention_s are removed
+    def __init__(self, path: str, open_writer: Callable[[bool], object], append: bool, rotate_s: float,
+                 retention_s: Optional[float]):
+        self.path = path
+        self.open_writer = open_writer
+        self.rotate_s = rotate_s
+        self.retention_s = retention_s
+        self.writer = open_writer(append)
+        # an appended file is rotated after the date of its first sample, not after the restart
+        self.start = (first_date(path) if append else None) or datetime.datetime.now()
+
+    def write(self, date: datetime.datetime, device: str, packet: BroadcastPacket, analytics: Optional[AnalyticsResult] = None):
+        if (date - self.start).total_seconds() >= self.rotate_s:
+            self.writer.close()
+            os.replace(self.path, segment_path(self.path, self.start))
+            if self.retention_s is not None:
+                purge_segments(self.path, self.retention_s)
+            flags = getattr(self.writer, "flags", 0)  # a gap before this sample, queued by BinaryWriter
+            self.writer = self.open_writer(False)
+            if flags:
+                self.writer.flags = flags
+            self.start = date
+        self.writer.write(date, device, packet, analytics)
+
+    def write_gap(self, device: str, gap: Gap):
+        self.writer.write_gap(device, gap)
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+
+def device_worker(path: str, mode: str, samples: queue.Queue, stop: threading.Event, metrics: Metrics,
+                  capture=None):
+    session = Session(lambda: connect(path, metrics=metrics, capture=capture), lambda dl24: iter_packets(dl24, mode), stop,
+                      watch_path=None if is_daemon_socket(path) else path)
+    for date, event in session.events():
+        samples.put((date, path, event))
+
+
 def main():
     argparser = argparse.ArgumentParser()
-    argparser.add_argument('-p', '--path', type=str, metavar="PATH", required=True)
+    argparser.add_argument('-p', '--path', type=str, metavar="PATH", required=True, action="extend", nargs="+")
     argparser.add_argument('-o', '--output', type=str, metavar="PATH")
     argparser.add_argument('-a', '--append', action='store_true')
+    argparser.add_argument('-f', '--format', choices=["csv", "binary"], default="csv")
+    argparser.add_argument('-m', '--mode', choices=["broadcast", "poll"], default="broadcast",
+                           help="log broadcast frames (0.1 V, 10 mAh, 10 mWh steps) or poll every measurement "
+                                "(1 mV, 1 mAh, 1 mWh steps), defaults to broadcast")
     argparser.add_argument('-d', '--debug', action='store_true')
     argparser.add_argument('--override', action='store_true')
+    argparser.add_argument('--capture', type=str, metavar="PATH", help="record the raw serial byte stream to PATH")
+    argparser.add_argument('--rollup', type=str, metavar="TIERS", nargs="?", const="",
+                           help="also write min/max/mean/last buckets next to the output, defaults to 1m,1h")
+    argparser.add_argument('--rotate', type=float, metavar="HOURS", help="start a new output file every HOURS")
+    argparser.add_argument('--retention', type=float, metavar="DAYS", help="remove rotated output files older than DAYS")
+    argparser.add_argument('-A', '--analytics', action='store_true',
+                           help="show and log host-integrated charge and energy, internal resistance and time to cutoff")
+    argparser.add_argument('--cutoff', type=float, metavar="VOLTS", help="cutoff voltage for the time to cutoff estimate")
+    argparser.add_argument('--metrics-port', type=int, metavar="PORT", help="serve Prometheus metrics on http://ADDRESS:PORT/metrics")
+    argparser.add_argument('--metrics-address', type=str, metavar="ADDRESS", default="127.0.0.1")
 
     args = argparser.parse_args()
 
@@ -27,9 +222,29 @@ def main():
                         format="[%(asctime)s] [%(name)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
 
     out_path = args.output
+    paths = list(dict.fromkeys(args.path))
+    multi_device = len(paths) > 1
+
+    if (args.rollup is not None or args.rotate is not None) and out_path is None:
+        print("Rollups and rotation need an output file")
+        sys.exit(1)
+    if args.retention is not None and args.rotate is None:
+        print("Retention applies to rotated files, specify --rotate")
+        sys.exit(1)
 
-    csvfile = None
-    wr = None
+    tiers = None
+    if args.rollup is not None:
+        if multi_device:
+            print("Rollups support a single device only")
+            sys.exit(1)
+        from dl24.rollup import RollupError, TieredRollup, DefaultTiers, parse_tiers  # NumPy is only needed for rollups
+        try:
+            tiers = parse_tiers(args.rollup or DefaultTiers)
+        except RollupError as e:
+            print(e)
+            sys.exit(1)
+
+    writer = None
     if out_path is not None:
         exists = os.path.exists(out_path)
 
@@ -37,64 +252,118 @@ def main():
             print("Output file already exists. Specify --append or --override")
             sys.exit(1)
 
-        if args.append:
-            is_new = not exists
-            csvfile = open(out_path, 'a', newline='')
+        if args.format == "binary":
+            if multi_device:
+                print("Binary output supports a single device only")
+                sys.exit(1)
+
+            def open_writer(append: bool):
+                return BinaryWriter(out_path, append=append)
         else:
-            is_new = True
-            csvfile = open(out_path, 'w', newline='')
+            def open_writer(append: bool):
+                return CsvLogWriter(out_path, append=append, with_device=multi_device, with_analytics=args.analytics)
 
-        wr = csv.writer(csvfile)
-        if is_new:
-            wr.writerow(['date', 'voltage', 'current', 'power', 'energy', 'charge', 'temp', 'time_seconds', 'time_str'])
+        if args.rotate is not None:
+            writer = RotatingWriter(out_path, open_writer, args.append, args.rotate * 3600,
+                                    args.retention * 86400 if args.retention is not None else None)
+        else:
+            writer = open_writer(args.append)
 
-    while True:
-        dl24 = None
+    rollups = None
+    if tiers is not None:
         try:
-            dl24 = DL24(args.path)
-
-            while True:
-                dl24.wait_for_broadcast()
-                voltage = dl24.get_voltage()
-                current = dl24.get_current()
-                temp = dl24.get_temp()
-                energy = dl24.get_energy()
-                charge = dl24.get_charge()
-                on_time = dl24.get_time()
-
-                days = on_time.days
-                seconds = on_time.seconds
-                hours = seconds // 3600
-                minutes = (seconds // 60) % 60
-                seconds = seconds % 60
-
-                time_sec = int(on_time.total_seconds())
-                time_str = f"{days:01d}d {hours:02d}:{minutes:02d}:{seconds:02d}"
-                data = [
-                    datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    f"{voltage:.2f}",
-                    f"{current:.2f}",
-                    f"{voltage * current:.2f}",
-                    f"{energy:.2f}",
-                    f"{charge:.2f}",
-                    f"{temp:.0f}",
-                    f"{time_sec}",
-                    time_str,
-                ]
-
-                print_line(f"{voltage:5.02f} V | {current:5.2f} A | {voltage * current:5.2f} W | {energy:6.2f} Wh | {charge:5.2f} Ah | {time_str} | {temp} °C")
-
-                if csvfile is not None and wr is not None:
-                    wr.writerow(data)
-                    csvfile.flush()
-        except KeyboardInterrupt:
-            return
-        except DL24Error as e:
-            print_line(f"Serial error: {e}")
-            time.sleep(1)
-        finally:
-            if dl24 is not None:
-                dl24.close()
+            rollups = TieredRollup(out_path, tiers, append=args.append)
+        except RollupError as e:
+            print(e)
+            sys.exit(1)
+
+    capture = None
+    if args.capture is not None:
+        if multi_device:
+            print("Capture supports a single device only")
+            sys.exit(1)
+        if os.path.exists(args.capture) and not args.override:
+            print("Capture file already exists. Specify --override")
+            sys.exit(1)
+        from dl24.capture import CaptureWriter  # NumPy is only needed when capturing
+        capture = CaptureWriter(args.capture)
+
+    metrics = {path: Metrics() for path in paths}
+    if args.metrics_port is not None:
+        from dl24.metrics import serve_metrics
+        serve_metrics(args.metrics_address, args.metrics_port, lambda: metrics)
+
+    analytics = {path: StreamingAnalytics(args.cutoff) for path in paths} if args.analytics else None
+
+    samples = queue.Queue()
+    stop = threading.Event()
+    for path in paths:
+        threading.Thread(target=device_worker, args=(path, args.mode, samples, stop, metrics[path], capture), daemon=True).start()
+
+    def show(path: str, txt: str):
+        if multi_device:
+            print(f"{path}: {txt}")
+        else:
+            print_line(txt)
+
+    # outputs are flushed on a timer, also while the devices are silent or reconnecting
+    last_flush = time.monotonic()
+    unflushed = False
+    try:
+        while True:
+            now = time.monotonic()
+            if unflushed and now - last_flush >= FlushInterval_s:
+                writer.flush()
+                if rollups is not None:
+                    rollups.flush()
+                last_flush = now
+                unflushed = False
+
+            try:
+                date, path, packet = samples.get(timeout=FlushInterval_s)
+            except queue.Empty:
+                continue
+
+            if isinstance(packet, DL24Error):
+                show(path, f"Serial error: {packet}")
+                continue
+
+            if isinstance(packet, Gap):
+                show(path, format_gap(packet))
+                if not multi_device:
+                    print()
+                if writer is not None:
+                    writer.write_gap(path, packet)
+                    unflushed = True
+                continue
+
+            result = None
+            if analytics is not None:
+                analytics[path].add(date.timestamp(), packet)
+                result = analytics[path].result()
+
+            time_str = format_on_time(packet.time)
+            line = f"{packet.voltage:5.02f} V | {packet.current:5.2f} A | {packet.power:5.2f} W | {packet.energy:6.2f} Wh | " \
+                   f"{packet.capacity:5.2f} Ah | {time_str} | {packet.temperature} °C"
+            if result is not None:
+                line += " | " + format_analytics(result)
+            show(path, line)
+
+            if rollups is not None:
+                rollups.add(date, packet)
+            if writer is not None:
+                writer.write(date, path, packet, result)
+                unflushed = True
+    except KeyboardInterrupt:
+        return
+    finally:
+        stop.set()
+        if writer is not None:
+            writer.close()
+        if rollups is not None:
+            rollups.close()
+        if capture is not None:
+            capture.close()
 
 
 if __name__ == "__main__":
@@ -1,120 +1,278 @@
+import os
+import sys
+import math
 import argparse
-import csv
 import datetime
-import math
+from typing import Callable, List, Tuple, Optional
 
+import numpy as np
+import matplotlib
 from matplotlib import ticker
-from matplotlib.pyplot import figure
-import matplotlib.pyplot as plt
-from matplotlib.ticker import AutoMinorLocator
+from matplotlib.figure import Figure
 
+from dl24.dataset_cache import DatasetCache, DefaultCacheDir, DefaultCacheSize_MB
+from dl24.dataset import Dataset, load_log, downsample_minmax, find_logs
+from dl24.rollup import RollupError, parse_tier, format_tier, load_raw, load_range
+from dl24.tools.plotter.compare import make_run, run_names, summary, plot_comparison
 
-def main():
-    argparser = argparse.ArgumentParser()
-    argparser.set_defaults(cmd=lambda: None, cmd_args=lambda x: [])
-    argparser.add_argument('path', type=str, metavar="PATH")
+FigureWidth_in = 8.5
+FigureHeight_in = 7
+CompareFigureHeight_in = 10
 
-    args = argparser.parse_args()
 
-    csvfile = open(args.path, 'r', newline='')
-    wr = csv.reader(csvfile)
-
-    date_series = []
-    voltage_series = []
-    current_series = []
-    energy_series = []
-    charge_series = []
-
-    is_24v = False
-
-    energy_start = None
-    charge_start = None
-    energy_end = None
-    charge_end = None
-
-    first_date = None
-    entries_i = iter(wr)
-    next(entries_i)
-    for entry in entries_i:
-        dt = datetime.datetime.strptime(entry[0], "%Y-%m-%d %H:%M:%S")
-        if first_date is None:
-            first_date = dt
-
-        time_sec = (dt - first_date).total_seconds() / 60 / 60
-        date_series.append(time_sec)
-
-        voltage = float(entry[1])
-        current = float(entry[2])
-        energy = float(entry[4])
-        charge = float(entry[5])
-
-        if voltage > 20:
-            is_24v = True
-
-        if energy_start is None:
-            energy_start = energy
-        if charge_start is None:
-            charge_start = charge
-
-        energy_end = energy
-        charge_end = charge
-
-        voltage_series.append(voltage)
-        current_series.append(current)
-        energy_series.append((energy - energy_start) / 1000)
-        charge_series.append((charge - charge_start))
-
-    v_scale_mult = 2 if is_24v else 1
-    min_voltage = 9
-    max_voltage = 14
+def nice_ceil(value: float) -> float:
+    # smallest 1, 2 or 5 times a power of ten not less than value
+    if value <= 0:
+        return 1
+    exponent = math.floor(math.log10(value))
+    for m in (1, 2, 5, 10):
+        if m * 10 ** exponent >= value * (1 - 1e-9):
+            return m * 10 ** exponent
+
+
+def axis_range(values: np.ndarray, step: float) -> Tuple[float, float]:
+    # whole steps around the data, with the maximum always below the top edge
+    low = math.floor(values.min() / step) * step
+    high = (math.floor(values.max() / step) + 1) * step
+    return low, high
+
+
+def plot_dataset(fig: Figure, dataset: Dataset, max_points: int):
+    date_series = dataset.elapsed_hours
+    voltage_series = dataset.voltage
+    current_series = dataset.current
+    energy_series = (dataset.energy - dataset.energy[0]) / 1000
+    charge_series = dataset.charge - dataset.charge[0]
+
+    # axis ranges follow the data, rounded to whole steps
+    min_voltage, max_voltage = axis_range(voltage_series, 0.5)
     min_current = 0
-    max_current = 20
+    max_current = axis_range(current_series, nice_ceil(current_series.max()) / 10)[1]
     min_charge = 0
-    max_charge = math.ceil((charge_end - charge_start) / 50) * 50
+    max_charge = nice_ceil(charge_series[-1])
     min_energy = 0
-    max_energy = math.ceil((energy_end - energy_start) / 1000) * 1
+    max_energy = nice_ceil(energy_series[-1])
 
-    fig, (ax1_current, ax2_energy) = plt.subplots(2, 1)
-    fig.set_size_inches(8.5, 7)
+    ax1_current, ax2_energy = fig.subplots(2, 1)
 
     ax1_current.grid(True)
     ax1_current.set_xlabel("Time [h]", color='black')
     ax1_voltage = ax1_current.twinx()
 
     # Voltage
-    ax1_voltage.plot(date_series, voltage_series, color='green')
+    ax1_voltage.plot(*downsample_minmax(date_series, voltage_series, max_points), color='green')
     ax1_voltage.yaxis.set_major_formatter(ticker.FormatStrFormatter('%g V'))
-    # ax1_voltage.yaxis.set_minor_formatter(ticker.FormatStrFormatter('%.1f V'))
-    # ax1_voltage.yaxis.set_minor_locator(AutoMinorLocator())
-    ax1_voltage.set_ylim([min_voltage * v_scale_mult, max_voltage * v_scale_mult])
+    ax1_voltage.set_ylim([min_voltage, max_voltage])
     ax1_voltage.set_ylabel("Voltage", color='green')
-    # ax1_voltage.tick_params(axis='y', labelcolor='green')
 
     # Current
-    ax1_current.plot(date_series, current_series, color='red')
-    ax1_current.yaxis.set_major_formatter(ticker.FormatStrFormatter('%d A'))
+    ax1_current.plot(*downsample_minmax(date_series, current_series, max_points), color='red')
+    ax1_current.yaxis.set_major_formatter(ticker.FormatStrFormatter('%g A'))
     ax1_current.set_ylim([min_current, max_current])
     ax1_current.set_ylabel("Current", color='red')
-    ax1_current.set_yticks(range(0, max_current + 1, 2))
-    # ax1_current.tick_params(axis='y', labelcolor='red')
 
     ax2_energy.grid(True)
     ax2_charge = ax2_energy.twinx()
 
     # Energy
-    ax2_energy.plot(date_series, energy_series, color='orange')
-    ax2_energy.yaxis.set_major_formatter(ticker.FormatStrFormatter('%.1f'))
+    ax2_energy.plot(*downsample_minmax(date_series, energy_series, max_points), color='orange')
+    ax2_energy.yaxis.set_major_formatter(ticker.FormatStrFormatter('%g'))
     ax2_energy.set_ylim([min_energy, max_energy])
     ax2_energy.set_ylabel("Energy [kWh]", color='orange')
-    # ax2_energy.tick_params(axis='y', labelcolor='orange')
 
     # Charge
-    ax2_charge.plot(date_series, charge_series, color='red')
-    ax2_charge.yaxis.set_major_formatter(ticker.FormatStrFormatter('%d'))
+    ax2_charge.plot(*downsample_minmax(date_series, charge_series, max_points), color='red')
+    ax2_charge.yaxis.set_major_formatter(ticker.FormatStrFormatter('%g'))
     ax2_charge.set_ylim([min_charge, max_charge])
     ax2_charge.set_ylabel("Charge [Ah]", color='red')
-    # ax2_charge.tick_params(axis='y', labelcolor='red')
 
+
+def save_chart(dataset: Dataset, title: str, out_path: str, max_points: int):
+    # the figure is not attached to pyplot so no GUI backend is involved, also in worker processes
+    fig = Figure(figsize=(FigureWidth_in, FigureHeight_in))
+    plot_dataset(fig, dataset, max_points)
+    fig.suptitle(title)
+
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    try:
+        fig.savefig(tmp_path, format=os.path.splitext(out_path)[1][1:] or "png")
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def loader(cache: Optional[DatasetCache]) -> Callable[[str], Dataset]:
+    return cache.load if cache is not None else load_log
+
+
+def render_file(job: Tuple[str, str, int, Optional[DatasetCache]]) -> Tuple[str, Optional[str]]:
+    path, out_path, max_points, cache = job
+    try:
+        dataset = load_raw(path, loader=loader(cache))
+        if len(dataset) == 0:
+            return path, "log file is empty"
+        save_chart(dataset, os.path.basename(path), out_path, max_points)
+        return path, None
+    except Exception as e:
+        return path, str(e) or type(e).__name__
+
+
+def is_up_to_date(path: str, out_path: str) -> bool:
+    try:
+        return os.path.getmtime(out_path) >= os.path.getmtime(path)
+    except OSError:
+        return False
+
+
+def render_directory(directory: str, out_dir: Optional[str], out_format: str, jobs: int, force: bool, max_points: int,
+                     cache: Optional[DatasetCache]) -> int:
+    todo = []
+    skipped = 0
+    for path in find_logs([directory]):
+        base = os.path.relpath(path, directory) + "." + out_format  # test.csv.png, test.bin.png after dl24-convert
+        out_path = os.path.join(out_dir, base) if out_dir is not None else os.path.join(directory, base)
+        if not force and is_up_to_date(path, out_path):
+            skipped += 1
+            continue
+        todo.append((path, out_path, max_points, cache))
+
+    failed = 0
+    if jobs > 1 and len(todo) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(jobs) as executor:
+            results = list(executor.map(render_file, todo))
+    else:
+        results = [render_file(job) for job in todo]
+    for path, error in results:
+        if error is not None:
+            print(f"{path}: {error}")
+            failed += 1
+
+    print(f"{len(todo) - failed} rendered, {skipped} up to date, {failed} failed")
+    return failed
+
+
+def load_run(job: Tuple[str, Optional[datetime.datetime], Optional[datetime.datetime], Optional[DatasetCache]]):
+    # returns the dataset or the error message
+    path, since, until, cache = job
+    try:
+        return load_raw(path, since, until, loader(cache)), None
+    except Exception as e:
+        return None, str(e) or type(e).__name__
+
+
+def compare_logs(paths: List[str], axis: str, since: Optional[datetime.datetime], until: Optional[datetime.datetime],
+                 jobs: int, out_path: Optional[str], max_points: int, cache: Optional[DatasetCache]) -> int:
+    todo = [(path, since, until, cache) for path in paths]
+    if jobs > 1 and len(todo) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(min(jobs, len(todo))) as executor:
+            results = list(executor.map(load_run, todo))
+    else:
+        results = [load_run(job) for job in todo]
+
+    runs = []
+    for path, name, (dataset, error) in zip(paths, run_names(paths), results):
+        if error is None and len(dataset) == 0:
+            error = "no samples in the log file or the range"
+        if error is not None:
+            print(f"{path}: {error}")
+            continue
+        runs.append(make_run(name, dataset, axis))
+    if len(runs) == 0:
+        return 1
+
+    for line in summary(runs):
+        print(line)
+
+    figsize = (FigureWidth_in, CompareFigureHeight_in)
+    if out_path is not None:
+        fig = Figure(figsize=figsize)
+    else:
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize=figsize)
+    plot_comparison(fig, runs, axis, max_points)
+    fig.suptitle(f"{len(runs)} runs compared to {runs[0].name}")
+
+    if out_path is not None:
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        fig.savefig(out_path)
+    else:
+        plt.show()
+    return len(paths) - len(runs)
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.set_defaults(cmd=lambda: None, cmd_args=lambda x: [])
+    argparser.add_argument('path', type=str, nargs="+", metavar="PATH",
+                           help="log file, a directory of logs to render, or several log files to compare")
+    argparser.add_argument('--max-points', type=int, metavar="N",
+                           help="maximum number of plotted points per series, defaults to the figure width in pixels")
+    argparser.add_argument('-o', '--output', type=str, metavar="PATH",
+                           help="save the chart to a file instead of showing it, or the output directory when PATH is a directory")
+    argparser.add_argument('--format', choices=["png", "svg", "pdf"], default="png", help="output format when PATH is a directory")
+    argparser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help="rendering processes when PATH is a directory")
+    argparser.add_argument('--force', action='store_true', help="render charts that are newer than their logs too")
+    argparser.add_argument('--since', type=datetime.datetime.fromisoformat, metavar="DATE", help="plot samples from DATE on")
+    argparser.add_argument('--until', type=datetime.datetime.fromisoformat, metavar="DATE", help="plot samples before DATE")
+    argparser.add_argument('--tier', type=str, metavar="TIER",
+                           help="rollup tier to plot, e.g. 1m, or raw; by default the coarsest tier with enough points for the range")
+    argparser.add_argument('-f', '--follow', action='store_true',
+                           help="keep plotting rows appended to the log, or broadcasts when PATH is a serial port or a daemon socket")
+    argparser.add_argument('--window', type=float, default=10, metavar="MINUTES", help="rolling window length in follow mode")
+    argparser.add_argument('--interval', type=int, default=500, metavar="MS", help="refresh interval in follow mode")
+    argparser.add_argument('--axis', choices=["time", "charge"], default="time",
+                           help="common axis of compared logs, elapsed time or delivered charge")
+    argparser.add_argument('--cache-dir', type=str, metavar="DIR", default=DefaultCacheDir, help="parsed log cache directory")
+    argparser.add_argument('--cache-size', type=int, metavar="MB", default=DefaultCacheSize_MB,
+                           help="parsed log cache size limit, least recently used logs are removed above it")
+    argparser.add_argument('--no-cache', action='store_true', help="parse logs without the cache")
+
+    args = argparser.parse_args()
+
+    max_points = args.max_points or int(FigureWidth_in * matplotlib.rcParams["figure.dpi"])
+    cache = DatasetCache(args.cache_dir, args.cache_size * 1024 * 1024) if not args.no_cache else None
+
+    if len(args.path) > 1:
+        if args.follow or args.tier is not None or any(os.path.isdir(x) for x in args.path):
+            argparser.error("several paths can only be log files to compare, without --follow or --tier")
+        failed = compare_logs(args.path, args.axis, args.since, args.until, args.jobs, args.output, max_points, cache)
+        sys.exit(1 if failed else 0)
+    path = args.path[0]
+
+    if args.follow:
+        from dl24.tools.plotter.live import follow
+        follow(path, args.window / 60, args.interval, max_points, (FigureWidth_in, FigureHeight_in))
+        return
+
+    if os.path.isdir(path):
+        failed = render_directory(path, args.output, args.format, args.jobs, args.force, max_points, cache)
+        sys.exit(1 if failed else 0)
+
+    try:
+        if args.tier == "raw":
+            tier, dataset = None, load_raw(path, args.since, args.until, loader(cache))
+        else:
+            tier, dataset = load_range(path, args.since, args.until, max_points,
+                                       parse_tier(args.tier) if args.tier is not None else None, loader(cache))
+    except (RollupError, OSError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+    if len(dataset) == 0:
+        print("No samples in the log file or the range")
+        return
+
+    if args.output is not None:
+        title = os.path.basename(path) + (f" ({format_tier(tier)} rollup)" if tier is not None else "")
+        save_chart(dataset, title, args.output, max_points)
+        return
+
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=(FigureWidth_in, FigureHeight_in))
+    plot_dataset(fig, dataset, max_points)
     plt.show()
 
 
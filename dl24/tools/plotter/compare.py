@@ -0,0 +1,112 @@
+import os
+from dataclasses import dataclass
+from typing import List, Sequence
+
+import numpy as np
+from matplotlib import ticker
+from matplotlib.figure import Figure
+
+from dl24.dataset import Dataset, downsample_minmax
+
+AxisLabels = {
+    "time": "Time [h]",
+    "charge": "Delivered charge [Ah]",
+}
+
+
+@dataclass
+class Run:
+    name: str
+    dataset: Dataset
+    x: np.ndarray  # normalized axis, elapsed hours or delivered Ah, non-decreasing
+    charge: np.ndarray  # Ah delivered since the start of the log
+    energy: np.ndarray  # Wh
+
+    @property
+    def hours(self) -> float:
+        return float(self.dataset.elapsed_hours[-1])
+
+
+def make_run(name: str, dataset: Dataset, axis: str) -> Run:
+    charge = dataset.charge - dataset.charge[0]
+    energy = dataset.energy - dataset.energy[0]
+    x = dataset.elapsed_hours if axis == "time" else charge
+    # the charge stays the same over the rounding steps of CSV logs and drops when the counters are reset,
+    # np.interp needs an increasing axis
+    x = np.maximum.accumulate(x)
+    return Run(name, dataset, x, charge, energy)
+
+
+def run_names(paths: Sequence[str]) -> List[str]:
+    # file names, or paths relative to the common directory when file names repeat
+    names = [os.path.basename(x) for x in paths]
+    if len(set(names)) == len(names):
+        return names
+    common = os.path.commonpath([os.path.abspath(x) for x in paths])
+    return [os.path.relpath(os.path.abspath(x), common) for x in paths]
+
+
+def interp(grid: np.ndarray, run: Run, values: np.ndarray) -> np.ndarray:
+    # values at the first sample of every position of the axis
+    first = np.concatenate([[True], np.diff(run.x) > 0])
+    return np.interp(grid, run.x[first], values[first])
+
+
+def deltas(run: Run, reference: Run, points: int):
+    # charge and energy of run minus the reference at the same position of the normalized axis, over their overlap
+    grid = np.linspace(0, min(run.x[-1], reference.x[-1]), points)
+    return (grid,
+            interp(grid, run, run.charge) - interp(grid, reference, reference.charge),
+            interp(grid, run, run.energy) - interp(grid, reference, reference.energy))
+
+
+def summary(runs: Sequence[Run]) -> List[str]:
+    reference = runs[0]
+    lines = [f"{'run':<32} {'hours':>8} {'Ah':>9} {'Wh':>9} {'dAh':>8} {'dWh':>8} {'dWh%':>7}"]
+    for run in runs:
+        charge, energy = run.charge[-1], run.energy[-1]
+        d_charge, d_energy = charge - reference.charge[-1], energy - reference.energy[-1]
+        d_percent = d_energy / reference.energy[-1] * 100 if reference.energy[-1] > 0 else 0
+        lines.append(f"{run.name[:32]:<32} {run.hours:8.2f} {charge:9.3f} {energy:9.2f} {d_charge:+8.3f} {d_energy:+8.2f} {d_percent:+6.1f}%")
+    return lines
+
+
+def plot_comparison(fig: Figure, runs: Sequence[Run], axis: str, max_points: int):
+    # voltage and current of every run over the normalized axis, and their charge and energy differences from the first run
+    reference = runs[0]
+    ax_voltage, ax_current, ax_energy = fig.subplots(3, 1, sharex=True)
+    ax_charge = ax_energy.twinx() if axis == "time" else None  # the charge difference is zero along a charge axis
+    points = max(2, max_points // 2)
+
+    for i, run in enumerate(runs):
+        color = f"C{i % 10}"
+        label = f"{run.name}: {run.charge[-1]:.2f} Ah, {run.energy[-1]:.1f} Wh"
+        if i > 0:
+            label += f" ({run.charge[-1] - reference.charge[-1]:+.2f} Ah, {run.energy[-1] - reference.energy[-1]:+.1f} Wh)"
+        ax_voltage.plot(*downsample_minmax(run.x, run.dataset.voltage, max_points), color=color, linewidth=1, label=label)
+        ax_current.plot(*downsample_minmax(run.x, run.dataset.current, max_points), color=color, linewidth=1)
+
+        if i > 0:
+            grid, d_charge, d_energy = deltas(run, reference, points)
+            ax_energy.plot(grid, d_energy, color=color, linewidth=1)
+            if ax_charge is not None:
+                ax_charge.plot(grid, d_charge, color=color, linewidth=1, linestyle="--")
+
+    ax_voltage.grid(True)
+    ax_voltage.yaxis.set_major_formatter(ticker.FormatStrFormatter('%g V'))
+    ax_voltage.set_ylabel("Voltage")
+    ax_voltage.legend(fontsize="x-small", loc="best")
+
+    ax_current.grid(True)
+    ax_current.yaxis.set_major_formatter(ticker.FormatStrFormatter('%g A'))
+    ax_current.set_ylabel("Current")
+    ax_current.set_ylim(bottom=0)
+
+    ax_energy.grid(True)
+    ax_energy.axhline(0, color="black", linewidth=0.8)
+    ax_energy.yaxis.set_major_formatter(ticker.FormatStrFormatter('%+g'))
+    ax_energy.set_ylabel(f"Energy vs {reference.name} [Wh]")
+    ax_energy.set_xlabel(AxisLabels[axis])
+    if ax_charge is not None:
+        ax_charge.yaxis.set_major_formatter(ticker.FormatStrFormatter('%+g'))
+        ax_charge.set_ylabel("Charge [Ah], dashed")
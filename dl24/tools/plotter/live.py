@@ -0,0 +1,200 @@
+import os
+import stat
+import time
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib import ticker
+
+from dl24 import DL24Error, BroadcastPacket
+from dl24.client import connect, is_daemon_socket
+from dl24.dataset import Dataset, LogTail, IncrementalMinMax, samples_to_dataset
+from dl24.samples import SampleBuffer
+
+DeviceBufferSize = 86400  # samples kept by DeviceSource, a day of broadcasts
+WindowStep = 0.25  # part of the rolling window the view is shifted by once the data reaches its right edge
+ReconnectInterval_s = 1
+
+
+def is_device(path: str) -> bool:
+    return is_daemon_socket(path) or (os.path.exists(path) and stat.S_ISCHR(os.stat(path).st_mode))
+
+
+class DeviceSource:
+    def __init__(self, path: str, capacity: int = DeviceBufferSize):
+        self.path = path
+        self.buffer = SampleBuffer(capacity)
+        self.lock = threading.Lock()
+        self.read_total = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _on_broadcast(self, packet: BroadcastPacket):
+        with self.lock:
+            self.buffer.append_packet(time.time(), packet)
+
+    def _run(self):
+        while True:
+            dl24 = None
+            try:
+                dl24 = connect(self.path)
+                for packet in dl24.stream_broadcasts():
+                    self._on_broadcast(packet)
+            except DL24Error as e:
+                print(f"Serial error: {e}")
+                time.sleep(ReconnectInterval_s)
+            finally:
+                if dl24 is not None:
+                    dl24.close()
+
+    def read(self) -> Dataset:
+        with self.lock:
+            samples = self.buffer.last(self.buffer.total - self.read_total)
+            self.read_total = self.buffer.total
+            return samples_to_dataset(samples, time.localtime().tm_gmtoff)
+
+
+class BlitManager:
+    # redraws only the animated artists on top of a cached background, the background is refreshed on every full draw
+    def __init__(self, canvas, artists):
+        self.canvas = canvas
+        self.artists = artists
+        self.background = None
+        for artist in artists:
+            artist.set_animated(True)
+        canvas.mpl_connect("draw_event", self._on_draw)
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            self.canvas.figure.draw_artist(artist)
+
+    def update(self):
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
+        self.canvas.flush_events()
+
+
+def _grow_limits(limits: Optional[Tuple[float, float]], low: float, high: float, margin: float) -> Optional[Tuple[float, float]]:
+    if limits is not None and limits[0] <= low and high <= limits[1]:
+        return None
+    if limits is not None:
+        low = min(low, limits[0])
+        high = max(high, limits[1])
+    pad = max((high - low) * 0.1, margin)
+    return low - pad, high + pad
+
+
+class LivePlot:
+    def __init__(self, window_hours: float, max_points: int, size_in: Tuple[float, float]):
+        self.window = window_hours
+        self.start = None
+        self.full_draws = 0
+
+        self.window_x = np.zeros(0)
+        self.window_voltage = np.zeros(0)
+        self.window_current = np.zeros(0)
+        self.history_voltage = IncrementalMinMax(max_points // 2)
+        self.history_current = IncrementalMinMax(max_points // 2)
+        self.voltage_limits = None
+        self.current_limits = None
+
+        self.fig, (self.ax_window, self.ax_history) = plt.subplots(2, 1)
+        self.fig.set_size_inches(*size_in)
+
+        lines = []
+        self.twins = []
+        for ax in (self.ax_window, self.ax_history):
+            ax.grid(True)
+            ax.set_xlabel("Time [h]", color='black')
+            ax_voltage = ax.twinx()
+            ax_voltage.yaxis.set_major_formatter(ticker.FormatStrFormatter('%g V'))
+            ax_voltage.set_ylabel("Voltage", color='green')
+            ax.yaxis.set_major_formatter(ticker.FormatStrFormatter('%g A'))
+            ax.set_ylabel("Current", color='red')
+            lines.append(ax_voltage.plot([], [], color='green')[0])
+            lines.append(ax.plot([], [], color='red')[0])
+            self.twins.append(ax_voltage)
+        self.ax_window.set_title("Last %g min" % (window_hours * 60))
+        self.ax_history.set_title("Full history")
+        self.ax_history.set_xlim(0, window_hours)
+
+        self.window_voltage_line, self.window_current_line, self.history_voltage_line, self.history_current_line = lines
+        self.status = self.fig.text(0.01, 0.99, "", va="top", family="monospace")
+        self.fig.tight_layout(rect=(0, 0, 1, 0.96))
+
+        self.blit = BlitManager(self.fig.canvas, lines + [self.status])
+
+    def update(self, chunk: Dataset):
+        if len(chunk) == 0:
+            return
+        first_chunk = self.start is None
+        if first_chunk:
+            self.start = chunk.date[0]
+        x = (chunk.date - self.start) / np.timedelta64(1, "h")
+
+        self.window_x = np.concatenate([self.window_x, x])
+        self.window_voltage = np.concatenate([self.window_voltage, chunk.voltage])
+        self.window_current = np.concatenate([self.window_current, chunk.current])
+        first = np.searchsorted(self.window_x, self.window_x[-1] - self.window * (1 + WindowStep))
+        self.window_x = self.window_x[first:]
+        self.window_voltage = self.window_voltage[first:]
+        self.window_current = self.window_current[first:]
+
+        self.history_voltage.extend(x, chunk.voltage)
+        self.history_current.extend(x, chunk.current)
+
+        self.window_voltage_line.set_data(self.window_x, self.window_voltage)
+        self.window_current_line.set_data(self.window_x, self.window_current)
+        self.history_voltage_line.set_data(*self.history_voltage.series())
+        self.history_current_line.set_data(*self.history_current.series())
+        self.status.set_text(f"{chunk.voltage[-1]:5.02f} V | {chunk.current[-1]:5.2f} A | {chunk.power[-1]:6.2f} W | "
+                             f"{chunk.energy[-1]:6.2f} Wh | {chunk.charge[-1]:5.2f} Ah | {chunk.temperature[-1]:.0f} °C")
+
+        # axes are only rescaled in steps, each rescale needs a full redraw while everything else is blitted
+        redraw = False
+        x_last = x[-1]
+        if first_chunk or x_last > self.ax_window.get_xlim()[1]:
+            right = x_last + self.window * WindowStep
+            self.ax_window.set_xlim(right - self.window, right)
+            redraw = True
+        if x_last > self.ax_history.get_xlim()[1]:
+            self.ax_history.set_xlim(0, x_last * 2)
+            redraw = True
+
+        limits = _grow_limits(self.voltage_limits, chunk.voltage.min(), chunk.voltage.max(), 0.5)
+        if limits is not None:
+            self.voltage_limits = limits
+            for ax in self.twins:
+                ax.set_ylim(*limits)
+            redraw = True
+        limits = _grow_limits(self.current_limits, 0, chunk.current.max(), 0.5)
+        if limits is not None:
+            self.current_limits = (0, limits[1])
+            for ax in (self.ax_window, self.ax_history):
+                ax.set_ylim(*self.current_limits)
+            redraw = True
+
+        if redraw:
+            self.full_draws += 1
+            self.fig.canvas.draw()
+        else:
+            self.blit.update()
+
+
+def follow(path: str, window_hours: float, interval_ms: int, max_points: int, size_in: Tuple[float, float]):
+    source = DeviceSource(path) if is_device(path) else LogTail(path)
+    plot = LivePlot(window_hours, max_points, size_in)
+
+    timer = plot.fig.canvas.new_timer(interval=interval_ms)
+    timer.add_callback(lambda: plot.update(source.read()))
+    timer.start()
+    plt.show()
@@ -0,0 +1,73 @@
+import csv
+import sys
+import logging
+import argparse
+
+from dl24 import DL24Error
+from dl24.client import connect
+from dl24.profile import ProfileError, SetpointEvent, load_profile, ProfileRunner
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('-p', '--path', type=str, metavar="PATH", required=True)
+    argparser.add_argument('profile', type=str, metavar="PROFILE", help="YAML or JSON profile")
+    argparser.add_argument('-o', '--output', type=str, metavar="PATH", help="save setpoint timings to a CSV file")
+    argparser.add_argument('-n', '--dry-run', action='store_true', help="print the schedule without connecting")
+    argparser.add_argument('-d', '--debug', action='store_true')
+
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="[%(asctime)s] [%(name)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    try:
+        profile = load_profile(args.profile)
+    except (OSError, ProfileError) as e:
+        print(f"Invalid profile: {e}")
+        sys.exit(1)
+
+    if args.dry_run:
+        for setpoint in profile.setpoints:
+            print(f"{setpoint.at:10.3f} s | step {setpoint.step:3d} | {setpoint.current:6.3f} A")
+        print(f"{profile.duration:10.3f} s | end")
+        return
+
+    out_file = None
+    writer = None
+    if args.output is not None:
+        out_file = open(args.output, 'w', newline='')
+        writer = csv.writer(out_file)
+        writer.writerow(['step', 'current', 'target', 'sent', 'acked', 'lateness_ms'])
+
+    def on_event(event: SetpointEvent):
+        setpoint = event.setpoint
+        if event.acked is None:
+            print(f"{event.target:10.3f} s | step {setpoint.step:3d} | {setpoint.current:6.3f} A | skipped")
+            row = [setpoint.step, setpoint.current, f"{event.target:.3f}", "", "", ""]
+        else:
+            lateness_ms = (event.acked - event.target) * 1000
+            print(f"{event.target:10.3f} s | step {setpoint.step:3d} | {setpoint.current:6.3f} A | acked {lateness_ms:+7.1f} ms")
+            row = [setpoint.step, setpoint.current, f"{event.target:.3f}", f"{event.sent:.3f}", f"{event.acked:.3f}", f"{lateness_ms:.1f}"]
+        if writer is not None:
+            writer.writerow(row)
+
+    dl24 = None
+    try:
+        dl24 = connect(args.path)
+        reason = ProfileRunner(dl24, profile, on_event=on_event).run()
+        print(f"Stopped: {reason}")
+    except DL24Error as e:
+        print(f"Serial error: {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("Interrupted")
+    finally:
+        if dl24 is not None:
+            dl24.close()
+        if out_file is not None:
+            out_file.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -12,16 +12,33 @@ setup(
             "dl24.tools.manage",
             "dl24.tools.monitor",
             "dl24.tools.plotter",
+            "dl24.tools.emulator",
+            "dl24.tools.bench",
+            "dl24.tools.convert",
+            "dl24.tools.daemon",
+            "dl24.tools.run",
+            "dl24.tools.control",
+            "dl24.tools.catalog",
         ],
         install_requires=[
             'pyserial>=3.5',
+            'pyserial-asyncio>=0.6',
             'matplotlib>=3.1.1',
+            'numpy>=1.23',
+            'PyYAML>=5.1',
         ],
         entry_points={
             'console_scripts': [
                 'dl24-manage = dl24.tools.manage.__main__:main',
                 'dl24-monitor = dl24.tools.monitor.__main__:main',
                 'dl24-plotter = dl24.tools.plotter.__main__:main',
+                'dl24-emulator = dl24.tools.emulator.__main__:main',
+                'dl24-bench = dl24.tools.bench.__main__:main',
+                'dl24-convert = dl24.tools.convert.__main__:main',
+                'dl24-daemon = dl24.tools.daemon.__main__:main',
+                'dl24-run = dl24.tools.run.__main__:main',
+                'dl24-control = dl24.tools.control.__main__:main',
+                'dl24-catalog = dl24.tools.catalog.__main__:main',
             ],
         },
 )
@@ -0,0 +1,48 @@
+import unittest
+
+from dl24 import FrameDecoder, BroadcastPacket, ValueReplyPacket, AckReply
+from dl24.crc import calc_crc_for_payload
+
+# energy bytes 00 00 00 6f
+BroadcastPayload = bytes.fromhex("010200007300 2ee300240e0000006f0000000000000000 2d00072c1c3c00000000".replace(" ", ""))
+
+
+def broadcast(payload: bytes = BroadcastPayload) -> bytes:
+    return b"\xff\x55" + payload + bytes([calc_crc_for_payload(payload)])
+
+
+def decode(data: bytes):
+    decoder = FrameDecoder()
+    decoder.feed(data)
+    return list(decoder), decoder
+
+
+class FrameDecoderTest(unittest.TestCase):
+    def test_broadcast(self):
+        packets, decoder = decode(broadcast())
+        self.assertEqual(len(packets), 1)
+        self.assertIsInstance(packets[0], BroadcastPacket)
+        self.assertEqual(packets[0].voltage, 11.5)
+        self.assertEqual(decoder.metrics.crc_failures, 0)
+
+    def test_corrupted_broadcast_yields_no_ack(self):
+        frame = bytearray(broadcast())
+        frame[-1] ^= 0xff
+        self.assertIn(0x6f, frame[2:-1])
+        packets, decoder = decode(bytes(frame) + broadcast())
+        self.assertEqual([type(x) for x in packets], [BroadcastPacket])
+        self.assertEqual(decoder.metrics.crc_failures, 1)
+
+    def test_resync_inside_truncated_broadcast(self):
+        truncated = broadcast()[:20]
+        packets, _ = decode(truncated + broadcast())
+        self.assertEqual([type(x) for x in packets], [BroadcastPacket])
+
+    def test_replies_after_broadcast(self):
+        packets, _ = decode(broadcast() + b"\x6f" + b"\xca\xcb\x00\x04\xd2\xce\xcf")
+        self.assertEqual([type(x) for x in packets], [BroadcastPacket, AckReply, ValueReplyPacket])
+        self.assertEqual(packets[2].data, b"\x00\x04\xd2")
+
+
+if __name__ == "__main__":
+    unittest.main()